@@ -1,76 +1,86 @@
 import streamlit as st
-import os
 import re
 import json
-import sqlite3
 from datetime import datetime
-from utils.parser_docx import parse_docx_status
-from utils.parser_pdf import parse_pdf_status
-from utils.parser_pptx import parse_pptx_status
-from utils.parser_vtt import parse_vtt_status
-from utils.parser_email import parse_email_status
-from pipeline.compare import compare_kpis
-from pipeline.risk_detect import detect_risks
-from utils.openai_client import ask_gpt
+from pipeline.risk_detect import invalidate_risk_cache
+from pipeline.snapshot_deltas import update_snapshot_deltas
+from pipeline.ingest import ingest_batch
+from utils.openai_client import ask_gpt_async, run_concurrently
+from utils.llm_scheduler import get_scheduler_stats
+from utils.llm_cache import get_cache_stats, clear_cache
+from utils.extract_cache import get_extract_cache_stats, clear_extract_cache
+from utils.parser_registry import supported_extensions, get_import_report
+from utils.prompting import compact_json, get_usage_report
+from utils.db import DB_PATH, get_connection
+from utils.snapshot_store import save_snapshot, load_snapshot, content_hash, find_by_content_hash
+from utils.parser_excel import read_excel_snapshot, budget_totals
 import pandas as pd
 import math
 
 
 # ---------- INIT DB ----------
-DB_PATH = "data/project_data.db"
-os.makedirs("data", exist_ok=True)
-# Connect to SQLite database
-conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+# Connect to SQLite database (pending schema migrations run on first connect)
+conn = get_connection(DB_PATH)
 
 cursor = conn.cursor()
 
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS projects (
-    id TEXT PRIMARY KEY,
-    name TEXT,
-    issuer TEXT,
-    start_date TEXT,
-    summary TEXT,
-    contacts TEXT,
-    tags TEXT,
-    rfp_file TEXT,
-    status TEXT DEFAULT 'active',
-    created_at TEXT
-)
-''')
-
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS files (
-    id TEXT PRIMARY KEY,
-    project_id TEXT,
-    filename TEXT,
-    file_type TEXT,
-    snapshot_date TEXT,
-    report_date TEXT,
-    uploaded_at TEXT,
-    llm_output TEXT, 
-    FOREIGN KEY(project_id) REFERENCES projects(id)
-)
-
-''')
-
-# Create the risk_cache table if it doesn't exist
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS risk_cache (
-    project_id TEXT,
-    current_date TEXT,
-    previous_date TEXT,
-    snapshot_pair_hash TEXT PRIMARY KEY,
-    risk_json TEXT,
-    generated_at TEXT
-)
-""")
-
-conn.commit()
+
+def refresh_snapshot_deltas(project_id, file_id):
+    """
+    Stores the deltas of a just-saved snapshot. The snapshot itself is already committed,
+    so a failure only warns; the History page computes missing deltas on demand.
+    """
+    try:
+        update_snapshot_deltas(conn, project_id, file_id)
+    except Exception as e:
+        conn.rollback()
+        st.warning(f"⚠️ Snapshot saved, but its change summary could not be precomputed: {e}")
+
 
 # ---------- PAGE UI ----------
 st.set_page_config(page_title="🗂️ Project Manager Hub", layout="wide")
 st.title("🧩 Project Manager")
+
+with st.sidebar.expander("🧠 LLM Cache", expanded=False):
+    # Clearing runs before the stats are read, so they already show the emptied cache
+    if st.button("🗑️ Clear LLM Cache", key="clear_llm_cache"):
+        clear_cache()
+        st.success("LLM cache cleared.")
+    cache_stats = get_cache_stats()
+    st.markdown(
+        f"- Hits: **{cache_stats['hits']}**\n"
+        f"- Misses: **{cache_stats['misses']}**\n"
+        f"- Hit rate: **{cache_stats['hit_rate']:.0%}**\n"
+        f"- Entries: **{cache_stats['entries']}**"
+    )
+
+with st.sidebar.expander("📄 Extraction Cache", expanded=False):
+    if st.button("🗑️ Clear Extraction Cache", key="clear_extract_cache"):
+        clear_extract_cache()
+        st.success("Extraction cache cleared.")
+    extract_stats = get_extract_cache_stats()
+    st.markdown(
+        f"- Hits: **{extract_stats['hits']}**\n"
+        f"- Misses: **{extract_stats['misses']}**\n"
+        f"- Entries: **{extract_stats['entries']}** ({extract_stats['bytes'] / 1e6:.1f} MB)"
+    )
+
+with st.sidebar.expander("⏱️ Parser Imports", expanded=False):
+    # Parser modules load on first use; this shows which have been paid for so far
+    st.dataframe(pd.DataFrame(get_import_report()).set_index("module"))
+
+with st.sidebar.expander("📊 LLM Token Usage", expanded=False):
+    usage_rows = get_usage_report()
+    if usage_rows:
+        st.dataframe(pd.DataFrame(usage_rows).set_index("call_site"))
+    else:
+        st.caption("No LLM calls yet in this session.")
+    scheduler_stats = get_scheduler_stats()
+    st.caption(
+        f"Requests: {scheduler_stats['requests']} · Retries: {scheduler_stats['retries']} · "
+        f"429s: {scheduler_stats['rate_limited']} · Throttled: {scheduler_stats['throttle_wait_seconds']:.1f}s"
+    )
+
 tabs = st.tabs([
     "➕ Initialize Project",
     "📁 Upload File",
@@ -128,161 +138,53 @@ with tabs[1]:
     # --- Upload File ---
     uploaded_files = st.file_uploader(
         "Upload project files (folder or multiple)", 
-        type=["docx", "pdf", "pptx", "vtt", "eml", "msg"], 
+        type=supported_extensions(), 
         accept_multiple_files=True
     )
 
     if uploaded_files:
-        for uploaded_file in uploaded_files:
-            file_type = uploaded_file.name.split(".")[-1].lower()
+        # --- Batch ingest: parallel parsing + bounded-concurrency LLM extraction ---
+        progress_bar = st.progress(0.0, text=f"Processing {len(uploaded_files)} file(s)...")
+        status_lines = [st.empty() for _ in uploaded_files]
+        stage_labels = {
+            "parsing": "⏳ Parsing",
+            "parsed": "📄 Parsed",
+            "extracting": "🧠 Extracting snapshot",
+            "done": "✅ Done",
+            "duplicate": "♻️ Already uploaded",
+            "failed": "❌ Failed",
+        }
+        finished = set()
+
+        def show_progress(index, name, stage):
+            status_lines[index].markdown(f"{stage_labels[stage]}: `{name}`")
+            if stage in ("done", "duplicate", "failed"):
+                finished.add(index)
+                progress_bar.progress(
+                    len(finished) / len(uploaded_files),
+                    text=f"Processed {len(finished)} of {len(uploaded_files)} file(s)"
+                )
+
+        results = ingest_batch(conn, selected_project, uploaded_files, on_progress=show_progress)
+
+        for uploaded_file, result in zip(uploaded_files, results):
             st.markdown(f"---\n### 📄 Processing: `{uploaded_file.name}`")
 
-            try:
-                if file_type == "docx":
-                    result = parse_docx_status(uploaded_file)
-                elif file_type == "pdf":
-                    result = parse_pdf_status(uploaded_file)
-                elif file_type == "pptx":
-                    result = parse_pptx_status(uploaded_file)
-                elif file_type == "vtt":
-                    result = parse_vtt_status(uploaded_file)
-                elif file_type in ["eml", "msg"]:
-                    result = parse_email_status(uploaded_file)
-                else:
-                    st.error("Unsupported file type.")
-                    continue
-            except Exception as e:
-                st.error(f"❌ Parsing failed: {e}")
+            if result["error"]:
+                st.error(f"❌ {result['error']}")
                 continue
 
-            raw_text = result.get("raw_text", "")
-            parsed = result.get("parsed", {})
-            report_date = parsed.get("report_date") or datetime.today().strftime("%Y-%m-%d")
-
-            from utils.openai_client import ask_gpt
-            import json
-
-            # --- Fetch prior snapshot ---
-            cursor.execute("""
-                SELECT llm_output FROM files
-                WHERE project_id = ? AND report_date < ?
-                ORDER BY report_date DESC
-                LIMIT 1
-            """, (selected_project, report_date))
-            row = cursor.fetchone()
-            previous_llm_output = json.loads(row[0]) if row else {}
-
-            # --- Ask GPT to revise prior snapshot using new document ---
-            gpt_prompt = f"""
-You are a project analyst. You are given two inputs:
-1. The current full project snapshot (in JSON format)
-2. A new document containing updated project information
-
-Your job is to revise the current snapshot. Overwrite any values in the JSON **only if the new document explicitly updates or corrects them**. You may also **append any new risks, issues, deliverables, or schedule items** mentioned in the document, if they do not already exist in the JSON.
-
-DO NOT delete or null out anything unless the document explicitly says it is removed. If the document provides no new information on a field, leave the previous value as is.
-
-Only return a valid JSON object.
-
---- CURRENT PROJECT SNAPSHOT ---
-{json.dumps(previous_llm_output, indent=2)}
-
---- NEW DOCUMENT TEXT ---
-{raw_text.strip()[:12000]}
-"""
-            revised_snapshot = ask_gpt(gpt_prompt)
-
-            # --- Mandatory JSON reformat pass ---
-            example_json_format = {
-                "report_date": "2025-07-31",
-                "source": "document",
-                "summary": None,
-                "kpis": {
-                    "budget": None,
-                    "timeline": None,
-                    "scope": None,
-                    "client_sentiment": None,
-                    "allotted_budget": None,
-                    "spent_budget": None,
-                    "remaining_budget": None,
-                    "percent_spent": None
-                },
-                "schedule": [
-                    {
-                        "Task ID": "",
-                        "Task Name": "",
-                        "Description": "",
-                        "Assigned To": "",
-                        "Start Date": "",
-                        "End Date": "",
-                        "Duration (Days)": 0,
-                        "Status": "",
-                        "Dependencies": ""
-                    }
-                ],
-                "issues": [
-                    {
-                        "Issue #": "",
-                        "Issue Creation Date": "",
-                        "Issue Category": "",
-                        "Issue Detail": "",
-                        "Recommended Action": "",
-                        "Owner": "",
-                        "Status": "",
-                        "Due Date": "",
-                        "Resolution": ""
-                    }
-                ],
-                "risks": [
-                    {
-                        "ID": "",
-                        "Division": "",
-                        "Task Area": "",
-                        "Risk Name": "",
-                        "Risk Description": "",
-                        "Risk Category": "",
-                        "Probability Rating": 0,
-                        "Impact Rating": 0,
-                        "Risk Rating": 0,
-                        "Impact If Not Mitigated": "",
-                        "Action/Mitigation Strategy": "",
-                        "Mitigation Owner(s)": "",
-                        "Action Taken?": "",
-                        "Date Identified": ""
-                    }
-                ],
-                "deliverables": [
-                    {
-                        "Deliverable": "",
-                        "Status": "",
-                        "Start Date": "",
-                        "Date Due": ""
-                    }
-                ],
-                "budget_details": [
-                    {
-                        "Category": "",
-                        "Allotted Budget": 0.0,
-                        "Spent Budget": 0.0,
-                        "Remaining Budget": 0.0,
-                        "Percent Spent": 0.0,
-                        "Notes": None
-                    }
-                ]
-            }
-
-            format_prompt = f"""
-Please take the following LLM-generated output and reformat it as a valid JSON string only. It must match the following structure:
-
-{json.dumps(example_json_format, indent=2)}
-
---- INPUT ---
-{revised_snapshot}
-"""
-            try:
-                structured = json.loads(ask_gpt(format_prompt))
-            except:
-                st.error("Failed to parse final JSON output. Please check the formatting.")
+            file_type = result["file_type"]
+            raw_text = result["raw_text"]
+            parsed = result["parsed"]
+            report_date = result["report_date"]
+            structured = result["structured"]
+
+            # Identical bytes were already ingested: reuse that record, nothing to save
+            if result["duplicate_of"]:
+                st.info(f"♻️ Identical to `{result['duplicate_of']}` — reusing its stored snapshot (no parsing or LLM calls).")
+                with st.expander("📌 Stored Snapshot", expanded=False):
+                    st.json(structured)
                 continue
 
             # Show preview
@@ -294,16 +196,13 @@ Please take the following LLM-generated output and reformat it as a valid JSON s
             # Save button
             if st.button(f"💾 Save {uploaded_file.name}", key=f"save_{uploaded_file.name}"):
                 file_id = f"{selected_project}_{report_date}"
-                cursor.execute("""
-                    INSERT OR REPLACE INTO files
-                    (id, project_id, filename, file_type, report_date, uploaded_at, raw_text, metadata, llm_output)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    file_id, selected_project, uploaded_file.name, file_type,
-                    report_date, datetime.now().isoformat(),
-                    raw_text, json.dumps(parsed), json.dumps(structured)
-                ))
-                conn.commit()
+                save_snapshot(
+                    conn, file_id, selected_project, uploaded_file.name, file_type,
+                    report_date, datetime.now().isoformat(), structured,
+                    raw_text=raw_text, metadata=parsed, digest=result["content_hash"]
+                )
+                invalidate_risk_cache(conn, selected_project, report_date)
+                refresh_snapshot_deltas(selected_project, file_id)
                 st.success(f"✅ `{uploaded_file.name}` saved to project.")
 
 
@@ -323,28 +222,40 @@ with tabs[2]:
         st.warning("Please select a project to proceed.")
         st.stop()
 
-    files = cursor.execute("""
-        SELECT filename, report_date, uploaded_at, llm_output
-        FROM files
-        WHERE project_id = ?
-        ORDER BY uploaded_at DESC
-    """, (selected_project_view,)).fetchall()
+    # Metadata only; a snapshot body is fetched when its file is opened
+    total_files = cursor.execute(
+        "SELECT COUNT(*) FROM files WHERE project_id = ?", (selected_project_view,)
+    ).fetchone()[0]
 
-    if not files:
+    if not total_files:
         st.info("No files uploaded for this project yet.")
     else:
-        for filename, report_date, uploaded_at, llm_output_json in files:
+        col1, col2 = st.columns(2)
+        page_size = col1.selectbox("Files per page", [10, 25, 50], key="view_page_size")
+        page_count = math.ceil(total_files / page_size)
+        page = col2.number_input(f"Page (of {page_count})", min_value=1, max_value=page_count, value=1, step=1, key="view_page")
+        st.caption(f"Showing {(page - 1) * page_size + 1}–{min(page * page_size, total_files)} of {total_files} files")
+
+        files = cursor.execute("""
+            SELECT id, filename, report_date, uploaded_at,
+                   llm_output IS NOT NULL AND TRIM(llm_output) NOT IN ('', 'null', '{}')
+            FROM files
+            WHERE project_id = ?
+            ORDER BY uploaded_at DESC
+            LIMIT ? OFFSET ?
+        """, (selected_project_view, page_size, (page - 1) * page_size)).fetchall()
+
+        for file_id, filename, report_date, uploaded_at, has_snapshot in files:
             st.markdown(f"### 📁 `{filename}`")
             st.markdown(f"- 🗓️ Report Date: **{report_date}**")
             st.markdown(f"- ⏱️ Uploaded At: `{uploaded_at}`")
 
-            if llm_output_json and llm_output_json.strip() not in ("", "null", "{}"):
-                try:
-                    llm_output = json.loads(llm_output_json)
-                    with st.expander("📌 Parsed Snapshot", expanded=False):
-                        st.json(llm_output)
-                except Exception as e:
-                    st.error(f"Error reading llm_output: {e}")
+            if has_snapshot:
+                if st.checkbox("📌 Show Parsed Snapshot", key=f"view_snapshot_{file_id}"):
+                    try:
+                        st.json(load_snapshot(conn, file_id))
+                    except Exception as e:
+                        st.error(f"Error reading llm_output: {e}")
             else:
                 st.info("No snapshot available for this file.")
 
@@ -358,13 +269,16 @@ with tabs[3]:
         submitted = st.form_submit_button("📅 Upload Snapshot")
 
     if submitted and uploaded_file:
+        excel_hash = content_hash(uploaded_file.getvalue())
+
         try:
-            xl = pd.ExcelFile(uploaded_file)
+            # Single read-only pass over the workbook; sections are picked from the result below
+            workbook = read_excel_snapshot(uploaded_file.getvalue())
 
             # --- Title Page: Basic Project Info ---
-            title_df = xl.parse("Contents", header=None)
+            title = workbook["contents"]
 
-            raw_date = title_df.iloc[6, 5]  # F7
+            raw_date = title["date"]  # F7
             if pd.notnull(raw_date):
                 try:
                     # Ensure it's a datetime object, then convert to string
@@ -374,28 +288,44 @@ with tabs[3]:
             else:
                 date = datetime.today().strftime("%Y-%m-%d")
 
-            name = title_df.iloc[2, 1]       # B3
-            issuer = title_df.iloc[1, 1]     # B4
-            start_date = title_df.iloc[4, 1] # B5
-            summary = title_df.iloc[5, 1]    # B6
-            tags = title_df.iloc[9, 1]       # B10
-            status = title_df.iloc[1, 1]     # B2
+            name = title["name"]              # B3
+            issuer = title["issuer"]          # B2
+            start_date = title["start_date"]  # B5
+            summary = title["summary"]        # B6
+            tags = title["tags"]              # B10
+            status = title["issuer"]          # B2
             created_at = datetime.now().isoformat()
 
             if not name:
                 st.error("❌ 'Project Name' is required in the Title Page.")
                 st.stop()
 
-            project_id = name.strip().lower().replace(" ", "_")
+            project_id = str(name).strip().lower().replace(" ", "_")
+
+            # --- Skip workbooks already ingested for this project (same bytes) ---
+            existing_upload = find_by_content_hash(conn, excel_hash, project_id=project_id)
+            if existing_upload:
+                st.info(
+                    f"♻️ This workbook was already uploaded as `{existing_upload['file_id']}` "
+                    f"({existing_upload['uploaded_at'][:10]}) — reusing its stored snapshot."
+                )
+                with st.expander("📌 Stored Snapshot", expanded=False):
+                    st.json(existing_upload["snapshot"])
+                st.stop()
 
-            # --- Contacts Sheet: Flexible Multi-Row Contacts ---
-            df_contacts = xl.parse("Contents", header=None)
-            df_clean = df_contacts.iloc[20:, 0:4]  # From row 21 down, columns A–D
-            df_clean = df_clean.dropna(how="all")
-            df_clean = df_clean.dropna(subset=[1])  # Require Name
-            df_clean.columns = ["Role", "Name", "Organization", "Email"]
-            contacts_list = df_clean.to_dict(orient="records")
-            contacts_json = json.dumps(contacts_list)
+            # --- Contacts: Flexible Multi-Row Contacts (rows 21+, columns A–D) ---
+            contacts_list = workbook["contacts"]
+            contacts_json = json.dumps(contacts_list, default=str)
+
+            # --- Helper to Report Sheets That Could Not Be Used ---
+            def section_problem(section, sheet, label):
+                """Warning text for a section missing from workbook["sections"], or None."""
+                if section in workbook["errors"]:
+                    return f"⚠️ Could not parse {sheet} sheet: {workbook['errors'][section]}"
+                if section in workbook["missing"]:
+                    missing = ", ".join(workbook["missing"][section])
+                    return f"⚠️ {sheet} sheet missing expected columns ({missing}). Skipping {label} parsing."
+                return None
 
            # --- Check if Project Already Exists ---
             cursor.execute("SELECT id FROM projects WHERE id = ?", (project_id,))
@@ -424,7 +354,7 @@ with tabs[3]:
                 BEFORE the current_uploaded_at timestamp.
                 """
                 cursor.execute("""
-                    SELECT llm_output 
+                    SELECT id 
                     FROM files 
                     WHERE project_id = ? AND uploaded_at < ?
                     ORDER BY uploaded_at DESC
@@ -435,7 +365,7 @@ with tabs[3]:
 
                 if row:
                     try:
-                        output = json.loads(row[0])
+                        output = load_snapshot(conn, row[0])
                         return output.get("kpis", {}).get("client_sentiment", "Positive")
                     except:
                         return "Positive"
@@ -445,132 +375,47 @@ with tabs[3]:
 
 
             # --- Budget Sheet: Extract Budget Data ---
-            try:
-                budget_df = xl.parse("Budget", header=1)  # Header is on row 2 (index 1)
-                budget_df = budget_df.dropna(how="all")
-
-                expected_budget_cols = [
-                    "Category", "Allotted Budget", "Spent Budget",
-                    "Remaining Budget", "Percent Spent", "Notes"
-                ]
-
-                if all(col in budget_df.columns for col in expected_budget_cols):
-                    # Convert budget numbers to floats
-                    for col in ["Allotted Budget", "Spent Budget", "Remaining Budget", "Percent Spent"]:
-                        budget_df[col] = pd.to_numeric(budget_df[col], errors="coerce")
-
-                    budget_details = budget_df.to_dict(orient="records")
-
-                    # Safely extract top-level budget KPIs from the "Total" row
-                    total_row = budget_df[
-                        budget_df["Category"].astype(str).str.lower() == "total"
-                    ]
-
-                    if not total_row.empty:
-                        total_row = total_row.iloc[0]
-                        allotted = float(total_row["Allotted Budget"]) if pd.notnull(total_row["Allotted Budget"]) else None
-                        spent = float(total_row["Spent Budget"]) if pd.notnull(total_row["Spent Budget"]) else None
-                        remaining = float(total_row["Remaining Budget"]) if pd.notnull(total_row["Remaining Budget"]) else None
-                        percent_spent = float(total_row["Percent Spent"]) if pd.notnull(total_row["Percent Spent"]) else None
-                        st.success(f"✅ Parsed budget sheet with {len(budget_details)} categories.")
-                    else:
-                        st.warning("⚠️ Could not find 'Total' row in Budget sheet.")
-                        allotted = spent = remaining = percent_spent = None
-
-                else:
-                    st.warning("⚠️ Budget sheet missing expected columns. Skipping budget parsing.")
-                    allotted = spent = remaining = percent_spent = None
-                    budget_details = []
-
-            except Exception as e:
-                st.warning(f"⚠️ Could not parse Budget sheet: {e}")
-                allotted = spent = remaining = percent_spent = None
-                budget_details = []
-
+            budget_details = workbook["sections"].get("budget_details", [])
+            totals = budget_totals(budget_details)
+            problem = section_problem("budget_details", "Budget", "budget")
+            if problem:
+                st.warning(problem)
+            elif totals is not None:
+                st.success(f"✅ Parsed budget sheet with {len(budget_details)} categories.")
+            else:
+                st.warning("⚠️ Could not find 'Total' row in Budget sheet.")
 
+            # Top-level budget KPIs from the "Total" row; a blank cell only empties its own field
+            totals = totals or {}
+            allotted = totals.get("allotted_budget")
+            spent = totals.get("spent_budget")
+            remaining = totals.get("remaining_budget")
+            percent_spent = totals.get("percent_spent")
 
             # --- Schedule Sheet: Extract Task Data ---
-            try:
-                schedule_df = xl.parse("Schedule")
-                schedule_df = schedule_df.dropna(how="all")
-
-                expected_columns = [
-                    "Task ID", "Task Name", "Description", "Assigned To",
-                    "Start Date", "End Date", "Duration (Days)", "Status", "Dependencies"
-                ]
-
-                if all(col in schedule_df.columns for col in expected_columns):
-                    # Convert datetime columns to ISO string format
-                    schedule_df["Start Date"] = pd.to_datetime(schedule_df["Start Date"], errors="coerce").dt.strftime("%Y-%m-%d")
-                    schedule_df["End Date"] = pd.to_datetime(schedule_df["End Date"], errors="coerce").dt.strftime("%Y-%m-%d")
-
-                    # Extract only the expected columns, as list of dicts
-                    schedule = schedule_df[expected_columns].to_dict(orient="records")
-                    st.success(f"✅ Parsed {len(schedule)} tasks from the Schedule sheet.")
-                else:
-                    st.warning("⚠️ Schedule sheet missing expected columns. Skipping task parsing.")
-                    schedule = []
-            except Exception as e:
-                st.warning(f"⚠️ Failed to parse Schedule sheet: {e}")
-                schedule = []
-            
-            # --- Issue Log Sheet: Extract Issue Data ---
-            try:
-                issue_df = xl.parse("Issue Log")
-                issue_df = issue_df.dropna(how="all")
-
-                expected_issue_columns = [
-                    "Issue #", "Issue Creation Date", "Issue Category", "Issue Detail",
-                    "Recommended Action", "Owner", "Status", "Due Date", "Resolution"
-                ]
-
-                if all(col in issue_df.columns for col in expected_issue_columns):
-                    # Clean date columns to ensure valid ISO strings
-                    def clean_dates(df, cols):
-                        for col in cols:
-                            df[col] = pd.to_datetime(df[col], errors="coerce")
-                            df[col] = df[col].dt.strftime('%Y-%m-%d')  # force clean ISO format
-                        return df
-
-                    issue_df = clean_dates(issue_df, ["Issue Creation Date", "Due Date"])
-
-                    issues = issue_df[expected_issue_columns].to_dict(orient="records")
-                    st.success(f"✅ Parsed {len(issues)} issues from the Issue Log.")
-                else:
-                    st.warning("⚠️ Issue Log sheet missing expected columns. Skipping issue parsing.")
-                    issues = []
-            except Exception as e:
-                st.warning(f"⚠️ Failed to parse Issue Log sheet: {e}")
-                issues = []
+            schedule = workbook["sections"].get("schedule", [])
+            problem = section_problem("schedule", "Schedule", "task")
+            if problem:
+                st.warning(problem)
+            else:
+                st.success(f"✅ Parsed {len(schedule)} tasks from the Schedule sheet.")
 
+            # --- Issue Log Sheet: Extract Issue Data ---
+            issues = workbook["sections"].get("issues", [])
+            problem = section_problem("issues", "Issue Log", "issue")
+            if problem:
+                st.warning(problem)
+            else:
+                st.success(f"✅ Parsed {len(issues)} issues from the Issue Log.")
 
             # --- Deliverable Status Sheet ---
-            try:
-                deliverables_df = xl.parse("Deliverable Status")
-                deliverables_df = deliverables_df.dropna(how="all")
-
-                expected_deliverable_cols = [
-                    "Deliverable", "Status", "Start Date", "Date Due"
-                ]
-
-                if all(col in deliverables_df.columns for col in expected_deliverable_cols):
-                    # Ensure dates are parsed and formatted as ISO strings
-                    def clean_dates(df, cols):
-                        for col in cols:
-                            df[col] = pd.to_datetime(df[col], errors="coerce")
-                            df[col] = df[col].dt.strftime('%Y-%m-%d')  # Clean format
-                        return df
-
-                    deliverables_df = clean_dates(deliverables_df, ["Start Date", "Date Due"])
-
-                    deliverables = deliverables_df[expected_deliverable_cols].to_dict(orient="records")
-                    st.success(f"✅ Parsed {len(deliverables)} deliverables from Deliverable Status sheet.")
-                else:
-                    st.warning("⚠️ Deliverable Status sheet missing expected columns. Skipping deliverable parsing.")
-                    deliverables = []
-            except Exception as e:
-                st.warning(f"⚠️ Could not parse Deliverable Status sheet: {e}")
-                deliverables = []
+            deliverables = workbook["sections"].get("deliverables", [])
+            problem = section_problem("deliverables", "Deliverable Status", "deliverable")
+            if problem:
+                st.warning(problem)
+            else:
+                st.success(f"✅ Parsed {len(deliverables)} deliverables from Deliverable Status sheet.")
+
             # --- Helper Function to Clean NaNs for JSON ---
             def clean_nans(obj):
                 if isinstance(obj, dict):
@@ -580,43 +425,19 @@ with tabs[3]:
                 elif isinstance(obj, float) and math.isnan(obj):
                     return None
                 return obj
-            
-           # --- Risk Assessment Sheet: Extract Risk Data ---
-            try:
-                risk_df = xl.parse("Risk Assessment")
-
-                expected_risk_cols = [
-                    "ID", "Division", "Task Area", "Risk Name", "Risk Description",
-                    "Risk Category", "Probability Rating", "Impact Rating", "Risk Rating",
-                    "Impact If Not Mitigated", "Action/Mitigation Strategy", "Mitigation Owner(s)",
-                    "Action Taken?", "Date Identified"
-                ]
 
-                if all(col in risk_df.columns for col in expected_risk_cols):
-                    # Convert Risk Rating to numeric and drop if 0 or NaN
-                    risk_df["Risk Rating"] = pd.to_numeric(risk_df["Risk Rating"], errors="coerce")
-                    risk_df = risk_df[risk_df["Risk Rating"] > 0]
-
-                    # Clean dates
-                    risk_df["Date Identified"] = pd.to_datetime(risk_df["Date Identified"], errors="coerce")
-                    risk_df["Date Identified"] = risk_df["Date Identified"].dt.strftime('%Y-%m-%d')
-
-                    risks = risk_df[expected_risk_cols].to_dict(orient="records")
-                    st.success(f"✅ Parsed {len(risks)} risk(s) from Risk Assessment sheet.")
-                else:
-                    st.warning("⚠️ Risk Assessment sheet missing expected columns. Skipping risk parsing.")
-                    risks = []
-            except Exception as e:
-                st.warning(f"⚠️ Failed to parse Risk Assessment sheet: {e}")
-                risks = []
+            # --- Risk Assessment Sheet: Extract Risk Data (rows with Risk Rating > 0) ---
+            risks = workbook["sections"].get("risks", [])
+            problem = section_problem("risks", "Risk Assessment", "risk")
+            if problem:
+                st.warning(problem)
+            else:
+                st.success(f"✅ Parsed {len(risks)} risk(s) from Risk Assessment sheet.")
 
 
 
             # --- Helper to Evaluate Timeline with GPT ---
-            def assess_timeline_kpi(schedule, deliverables):
-                import json
-                from utils.openai_client import ask_gpt
-
+            async def assess_timeline_kpi(schedule, deliverables):
                 prompt = f"""
             You are a project health evaluator.
             Based on today's date, a list of schedule tasks and deliverables with start/end dates and statuses,
@@ -627,21 +448,19 @@ with tabs[3]:
             Your reply should be one of the two given phrases.
 
             Schedule:
-            {json.dumps(schedule, indent=2)}
+            {compact_json(schedule)}
 
             Deliverables:
-            {json.dumps(deliverables, indent=2)}
+            {compact_json(deliverables)}
             """
-                response = ask_gpt(prompt)
+                # Timeline health depends on today's date, so never serve it from the cache
+                response = await ask_gpt_async(prompt, use_cache=False, call_site="assess_timeline_kpi")
                 if "at-risk" in response.lower():
                     return "At-Risk"
                 return "On Track"
 
             # --- Helper to Evaluate Scope with GPT ---
-            def assess_scope_kpi(schedule, deliverables, issues):
-                import json
-                from utils.openai_client import ask_gpt
-
+            async def assess_scope_kpi(schedule, deliverables, issues):
                 prompt = f"""
             You are a scope change evaluator.
             Based on a project's current schedule, deliverables, and logged issues,
@@ -649,15 +468,15 @@ with tabs[3]:
             Return only one of those three phrases. Do not explain your reasoning.
 
             Schedule:
-            {json.dumps(schedule, indent=2)}
+            {compact_json(schedule)}
 
             Deliverables:
-            {json.dumps(deliverables, indent=2)}
+            {compact_json(deliverables)}
 
             Issues:
-            {json.dumps(issues, indent=2)}
+            {compact_json(issues)}
             """
-                response = ask_gpt(prompt)
+                response = await ask_gpt_async(prompt, call_site="assess_scope_kpi")
                 lowered = response.lower()
                 if "narrow" in lowered:
                     return "Scope Narrowed"
@@ -666,24 +485,31 @@ with tabs[3]:
                 return "Unchanged"
             
             # --- Construct llm_output Snapshot JSON ---
-            try:
-                allotted = float(total_row["Allotted Budget"])
-                spent = float(total_row["Spent Budget"])
-                remaining = float(total_row["Remaining Budget"])
-                percent_spent = float(total_row["Percent Spent"])
-            except:
-                allotted = spent = remaining = percent_spent = None
-            timeline_kpi = assess_timeline_kpi(schedule, deliverables)
+            # Timeline and scope assessments are independent, so run both LLM calls concurrently
+            timeline_kpi, scope_kpi = run_concurrently([
+                assess_timeline_kpi(schedule, deliverables),
+                assess_scope_kpi(schedule, deliverables, issues)
+            ], return_exceptions=True)
+
+            # A failed assessment (LLMError or any other exception) is left empty rather than guessed
+            if isinstance(timeline_kpi, BaseException):
+                st.warning(f"⚠️ Timeline could not be assessed: {timeline_kpi}")
+                timeline_kpi = None
+            if isinstance(scope_kpi, BaseException):
+                st.warning(f"⚠️ Scope could not be assessed: {scope_kpi}")
+                scope_kpi = None
             current_uploaded_at = datetime.now().isoformat()
             sentiment = get_previous_client_sentiment(cursor, selected_project_id, current_uploaded_at)
-            scope_kpi = assess_scope_kpi(schedule, deliverables, issues)
 
             llm_output = {
                 "report_date": date,
                 "source": "excel",
                 "summary": summary,
                 "kpis": {
-                    "budget": f"${allotted:,.0f} ({percent_spent:.0f}% used)" if allotted is not None else None,
+                    "budget": (
+                        f"${allotted:,.0f}" + (f" ({percent_spent:.0f}% used)" if percent_spent is not None else "")
+                        if allotted is not None else None
+                    ),
                     "timeline": timeline_kpi,
                     "scope": scope_kpi,
                     "client_sentiment": sentiment,
@@ -704,15 +530,13 @@ with tabs[3]:
 
             # --- Save to DB ---
             file_id = f"{selected_project_id}_{datetime.now().strftime('%Y%m%d%H%M%S')}"
-            cursor.execute("""
-                INSERT INTO files (id, project_id, filename, file_type, report_date, uploaded_at, llm_output)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            """, (
-                file_id, selected_project_id, uploaded_file.name, "excel",
-                llm_output_clean["report_date"], datetime.now().isoformat(),
-                json.dumps(llm_output_clean)
-            ))
-            conn.commit()
+            save_snapshot(
+                conn, file_id, selected_project_id, uploaded_file.name, "excel",
+                llm_output_clean["report_date"], datetime.now().isoformat(), llm_output_clean,
+                digest=excel_hash
+            )
+            invalidate_risk_cache(conn, selected_project_id, llm_output_clean["report_date"])
+            refresh_snapshot_deltas(selected_project_id, file_id)
 
             st.success("✅ Snapshot saved and Excel data parsed.")
 
@@ -1,51 +1,38 @@
 import streamlit as st
-import sqlite3
-import json
 import pandas as pd
-import matplotlib.pyplot as plt
-from datetime import datetime
-from pipeline.compare import compare_kpis
-from pipeline.risk_detect import detect_risks
-from pipeline.risk_detect import detect_risks_save
-import re
-from collections import defaultdict
-from utils.openai_client import ask_gpt
-from datetime import datetime
+from pipeline.snapshot_deltas import get_delta
+from pipeline.risk_detect import detect_risks_cached
+from utils.db import get_connection
+from utils.snapshot_repo import list_projects, list_snapshots, load_entries, get_data_version
+from utils.snapshot_repo import get_kpi_timeseries, get_budget_category_timeseries
 import plotly.express as px
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
 
 # === Streamlit Page Setup ===
 st.set_page_config(page_title="📈 Project History Dashboard", layout="wide")
 st.title("📚 Project History Overview")
 
 # === Connect to SQLite DB ===
-conn = sqlite3.connect("data/project_data.db")
-cursor = conn.cursor()
-
-# === Pull relevant fields ===
-# Includes uploaded_at to sort snapshots precisely
-cursor.execute("""
-    SELECT project_id, report_date, uploaded_at, llm_output
-    FROM files
-    WHERE report_date IS NOT NULL AND llm_output IS NOT NULL
-    ORDER BY project_id, uploaded_at DESC
-""")
-rows = cursor.fetchall()
-
-# === Build project_map with parsed JSON and full metadata ===
-# Each entry: project_id -> list of dicts with report_date, uploaded_at, parsed JSON
-project_map = defaultdict(list)
-
-for project_id, report_date, uploaded_at, llm_output in rows:
-    try:
-        parsed = json.loads(llm_output)
-        project_map[project_id].append({
-            "report_date": report_date,
-            "uploaded_at": uploaded_at,
-            "data": parsed
-        })
-    except Exception as e:
-        st.warning(f"⚠️ Skipping {project_id} on {report_date}: Invalid JSON — {e}")
-        continue
+conn = get_connection()
+
+# === Load snapshots lazily: metadata for the selectboxes, bodies only for the selected project ===
+def load_snapshots(project_id, limit=None):
+    """Decodes a project's snapshots newest upload first, skipping (and warning about) bad rows."""
+    entries = list_snapshots(project_id)
+    valid = []
+    step = limit or len(entries) or 1
+    for start in range(0, len(entries), step):
+        for entry in load_entries(entries[start:start + step]):
+            if entry["error"]:
+                st.warning(f"⚠️ Skipping {project_id} on {entry['report_date']}: {entry['error']}")
+                continue
+            if "kpis" not in entry["data"]:
+                st.warning(f"⚠️ {project_id} on {entry['report_date']} has no 'kpis' key.")
+            valid.append(entry)
+            if limit and len(valid) >= limit:
+                return valid
+    return valid
 
 # === TABS ===
 tabs = st.tabs(["🔁 Recent Trends", "📊 KPI History"])
@@ -54,31 +41,7 @@ tabs = st.tabs(["🔁 Recent Trends", "📊 KPI History"])
 with tabs[0]:
     st.subheader("🔍 Compare Latest KPI Snapshots")
 
-    # Dictionary to group all parsed snapshots by project
-    project_map = defaultdict(list)
-
-    # Parse rows and populate project_map
-    for project_id, report_date, uploaded_at, llm_output in rows:
-        if not llm_output or llm_output.strip() == "":
-            st.warning(f"⛔ Skipping {project_id} on {report_date}: Empty `llm_output`")
-            continue
-
-        try:
-            parsed = json.loads(llm_output)
-        except Exception as e:
-            st.error(f"❌ Skipping {project_id} on {report_date}: Invalid JSON — {e}")
-            continue
-
-        if "kpis" not in parsed:
-            st.warning(f"⚠️ {project_id} on {report_date} has no 'kpis' key.")
-
-        project_map[project_id].append({
-            "report_date": report_date,
-            "uploaded_at": uploaded_at,
-            "data": parsed
-        })
-
-    project_names = sorted(project_map.keys())
+    project_names = list_projects()
 
     if not project_names:
         st.error("🚫 No valid project data found. Please check your database.")
@@ -95,12 +58,8 @@ with tabs[0]:
     if selected_project:
         st.markdown(f"### 🧹 {selected_project.replace('_', ' ').title()}")
 
-        # Sort using uploaded_at timestamp (ensures accuracy even with same report_date)
-        snapshots = sorted(
-            project_map[selected_project],
-            key=lambda x: datetime.strptime(x["uploaded_at"], "%Y-%m-%dT%H:%M:%S.%f"),
-            reverse=True
-        )
+        # Latest two valid snapshots by uploaded_at (accurate even with the same report_date)
+        snapshots = load_snapshots(selected_project, limit=2)
 
         if len(snapshots) < 2:
             st.warning("Not enough snapshots to compare.")
@@ -113,6 +72,25 @@ with tabs[0]:
             date_latest = latest["report_date"]
             date_prev = previous["report_date"]
 
+            # Precomputed at save time (snapshot_deltas); computed once and stored if missing
+            delta = get_delta(
+                conn, selected_project, previous["file_id"], latest["file_id"],
+                previous_snapshot=prev_data, current_snapshot=latest_data
+            )
+
+            st.subheader("🧮 Change Summary")
+            summary_cols = st.columns(5)
+            for col, (label, key) in zip(summary_cols, [
+                ("Budget", "budget_changes"), ("Deliverables", "deliverable_changes"),
+                ("Issues", "issue_changes"), ("Schedule", "schedule_changes"), ("Risks", "risk_changes")
+            ]):
+                changes = delta.get(key, {})
+                col.metric(label, sum(len(changes.get(kind, [])) for kind in ("added", "removed", "changed")))
+                col.caption(
+                    f"🆕 {len(changes.get('added', []))} · ❌ {len(changes.get('removed', []))} · "
+                    f"🔁 {len(changes.get('changed', []))}"
+                )
+
             st.subheader("📉 KPI Changes")
 
             kpi_fields = ["allotted_budget", "percent_spent", "client_sentiment", "scope", "timeline"]
@@ -319,40 +297,42 @@ with tabs[0]:
         # ==============================
         # 📍 Detected Risks (LLM-Generated)
         # ==============================
-        
-        # Extract KPIs from snapshots
-        latest_kpis = latest_data.get("kpis", {})
-        prev_kpis = prev_data.get("kpis", {})
+        if len(snapshots) >= 2:
+            # KPI delta from the stored snapshot delta
+            kpi_delta = delta.get("kpi_changes", {})
+
+            # Risk detection is memoized in risk_cache, so reruns don't hit the LLM
+            risks = detect_risks_cached(
+                conn,
+                project_id=selected_project,
+                current_snapshot=latest_data,
+                previous_snapshot=prev_data,
+                delta_summary=kpi_delta,
+                current_date=date_latest,
+                previous_date=date_prev
+            )
 
-        # Compute KPI delta
-        kpi_delta = compare_kpis(latest_kpis, prev_kpis)
-
-        
-        # Run LLM risk detection before rendering UI
-        risks = detect_risks(
-            current_snapshot=latest_data,
-            delta_summary=kpi_delta
-        )
-
-        st.subheader("📍 Detected Risks from Snapshot Changes")
-
-        # Ensure risks is a list of dictionaries before proceeding
-        if isinstance(risks, list) and risks:
-            for idx, risk in enumerate(risks, start=1):
-                # Extract relevant fields with fallbacks
-                risk_name = risk.get("Risk Name", f"Unnamed Risk {idx}")
-                risk_description = risk.get("Risk Description", "No description provided.")
-                impact_rating = risk.get("Impact Rating", "N/A")
-                date_identified = risk.get("Date Identified", "N/A")
-
-                # Display each risk in a collapsible section
-                with st.expander(f"⚠️ {risk_name}", expanded=False):
-                    st.markdown(f"**📅 Date Identified:** `{date_identified}`")
-                    st.markdown(f"**🎯 Impact Rating:** `{impact_rating}` (Scale: 0–10)")
-                    st.markdown("**📝 Description:**")
-                    st.markdown(f"{risk_description}")
-        else:
-            st.info("✅ No new risks detected from snapshot differences.")
+            st.subheader("📍 Detected Risks from Snapshot Changes")
+
+            # Ensure risks is a list of dictionaries before proceeding
+            if isinstance(risks, list) and risks:
+                for idx, risk in enumerate(risks, start=1):
+                    # Extract relevant fields with fallbacks
+                    risk_name = risk.get("Risk Name", f"Unnamed Risk {idx}")
+                    risk_description = risk.get("Risk Description", "No description provided.")
+                    impact_rating = risk.get("Impact Rating", "N/A")
+                    date_identified = risk.get("Date Identified", "N/A")
+
+                    # Display each risk in a collapsible section
+                    with st.expander(f"⚠️ {risk_name}", expanded=False):
+                        st.markdown(f"**📅 Date Identified:** `{date_identified}`")
+                        st.markdown(f"**🎯 Impact Rating:** `{impact_rating}` (Scale: 0–10)")
+                        st.markdown("**📝 Description:**")
+                        st.markdown(f"{risk_description}")
+            elif isinstance(risks, dict) and risks.get("error"):
+                st.warning(f"⚠️ Risk detection failed ({risks.get('error_type', 'error')}): {risks['error']}")
+            else:
+                st.info("✅ No new risks detected from snapshot differences.")
 
     with st.expander("ℹ️ How to Use AI-Powered Risk Detection Effectively"):
         st.markdown("""
@@ -416,103 +396,86 @@ with tabs[0]:
 
 
 
+# === KPI History figures (cached per project and database version) ===
+@st.cache_data(max_entries=32, show_spinner=False)
+def build_kpi_figures(project_id, data_version):
+    """
+    Builds the KPI History charts from the materialized time series: overall utilization,
+    the timeline / scope / sentiment distributions, and one faceted figure holding every
+    budget category. data_version (PRAGMA data_version) only keys the cache.
+    Returns None when the project has no KPI rows.
+    """
+    kpi_rows = get_kpi_timeseries(project_id)
+    if not kpi_rows:
+        return None
+
+    df = pd.DataFrame(kpi_rows)
+    df["date"] = pd.to_datetime(df["date"])
+    df["percent_spent_display"] = pd.to_numeric(df["percent_spent"], errors="coerce") * 100
+
+    category_df = pd.DataFrame(
+        get_budget_category_timeseries(project_id),
+        columns=["date", "category", "percent_spent"]
+    )
+    category_df["date"] = pd.to_datetime(category_df["date"])
+    category_df["percent_spent_display"] = pd.to_numeric(category_df["percent_spent"], errors="coerce") * 100
+
+    # ----------------- Line Graph: Overall Percent Spent -----------------
+    overall_fig = px.line(
+        df, x="date", y="percent_spent_display", markers=True,
+        title="Total Budget % Spent Over Time",
+        labels={"date": "Date", "percent_spent_display": "Percent Spent (%)"}
+    )
+
+    # ----------------- Pie Charts for Timeline, Scope, Sentiment -----------------
+    pie_columns = [("timeline", "Timeline"), ("scope", "Scope"), ("sentiment", "Client Sentiment")]
+    pie_fig = make_subplots(rows=1, cols=3, specs=[[{"type": "domain"}] * 3], subplot_titles=[t for _, t in pie_columns])
+    for i, (col, title) in enumerate(pie_columns, start=1):
+        counts = df[col].value_counts(dropna=True)
+        pie_fig.add_trace(go.Pie(labels=counts.index.astype(str), values=counts.values, name=title), row=1, col=i)
+    pie_fig.update_traces(textinfo="percent+label")
+    pie_fig.update_layout(showlegend=False, margin=dict(t=60, b=20))
+
+    # ----------------- Per-Category Budget Trend Lines (small multiples) -----------------
+    category_fig = None
+    if not category_df.empty:
+        facet_cols = min(3, category_df["category"].nunique())
+        facet_rows = -(-category_df["category"].nunique() // facet_cols)
+        category_fig = px.line(
+            category_df, x="date", y="percent_spent_display", markers=True,
+            facet_col="category", facet_col_wrap=facet_cols,
+            facet_row_spacing=min(0.08, 0.5 / facet_rows),
+            labels={"date": "Date", "percent_spent_display": "Percent Spent (%)"},
+            height=max(300, 260 * facet_rows)
+        )
+        category_fig.for_each_annotation(lambda a: a.update(text=a.text.split("=", 1)[-1]))
+        category_fig.update_yaxes(matches=None, showticklabels=True)
+
+    return overall_fig, pie_fig, category_fig
+
+
 # === TAB 2: KPI HISTORY ===
 with tabs[1]:
     st.subheader("📊 KPI Trends Over Time")
 
     selected_project = st.selectbox("Select a project to view KPI trends", project_names)
 
-    # Retrieve and sort snapshots by date
-    raw_snapshots = project_map[selected_project]
-    snapshots = sorted(raw_snapshots, key=lambda x: x["report_date"])
-
+    # Built from the materialized time series; rebuilt only when the database changes
+    figures = build_kpi_figures(selected_project, get_data_version())
 
-    if not snapshots:
+    if figures is None:
         st.info("No KPI snapshots found for this project.")
         st.stop()
+    overall_fig, pie_fig, category_fig = figures
 
-    # ----------------- Build DataFrame -----------------
-    data = []
-    category_trends = {}  # For tracking category-level budget trends
-
-    for snap in snapshots:
-        kpis = snap["data"].get("kpis", {})
-        budget_details = snap["data"].get("budget_details", [])
-        report_date = snap["report_date"]
-
-        # Top-level KPI row
-        row = {
-            "date": report_date,
-            "budget": kpis.get("budget"),
-            "timeline": kpis.get("timeline"),
-            "scope": kpis.get("scope"),
-            "sentiment": kpis.get("client_sentiment"),
-            "percent_spent": kpis.get("percent_spent", None)
-        }
-        data.append(row)
-
-        # Track category-level budget percent spent
-        for bd in budget_details:
-            category = bd.get("Category")
-            if not category or category.lower() == "total":
-                continue  # Skip total row
-
-            if category not in category_trends:
-                category_trends[category] = []
-
-            category_trends[category].append({
-                "date": report_date,
-                "percent_spent": bd.get("Percent Spent", None)
-            })
-
-    df = pd.DataFrame(data)
-    df["date"] = pd.to_datetime(df["date"])
-    df = df.sort_values("date")
-
-    # ----------------- Line Graph: Overall Percent Spent -----------------
     st.subheader("📈 Overall Budget Utilization")
+    st.plotly_chart(overall_fig, use_container_width=True)
 
-    # Convert decimal to actual percent
-    df["percent_spent_display"] = df["percent_spent"] * 100
+    st.subheader("🥧 Timeline, Scope & Client Sentiment Distribution")
+    st.plotly_chart(pie_fig, use_container_width=True)
 
-    fig, ax = plt.subplots()
-    ax.plot(df["date"], df["percent_spent_display"], marker="o")
-    ax.set_ylabel("Percent Spent (%)")
-    ax.set_xlabel("Date")
-    ax.set_title("Total Budget % Spent Over Time")
-    fig.autofmt_xdate(rotation=45)
-    ax.tick_params(axis='x', labelsize=9)
-    st.pyplot(fig)
-
-    # ----------------- Pie Charts for Timeline, Scope, Sentiment -----------------
-    def pie_chart(col, title):
-        st.subheader(f"🥧 {title}")
-        counts = df[col].value_counts(dropna=True)
-        fig, ax = plt.subplots()
-        ax.pie(counts, labels=counts.index, autopct="%1.1f%%", startangle=140)
-        ax.axis("equal")
-        st.pyplot(fig)
-
-    pie_chart("timeline", "Timeline Distribution")
-    pie_chart("scope", "Scope Distribution")
-    pie_chart("sentiment", "Client Sentiment Distribution")
-
-    # ----------------- Per-Category Budget Trend Lines -----------------
     st.subheader("💡 Budget Category Utilization Over Time")
-    for category, entries in category_trends.items():
-        cat_df = pd.DataFrame(entries)
-        cat_df["date"] = pd.to_datetime(cat_df["date"])
-        cat_df = cat_df.sort_values("date")
-
-        # Convert to percent
-        cat_df["percent_spent_display"] = cat_df["percent_spent"] * 100
-
-        fig, ax = plt.subplots()
-        ax.plot(cat_df["date"], cat_df["percent_spent_display"], marker="o")
-        ax.set_ylabel("Percent Spent (%)")
-        ax.set_xlabel("Date")
-        ax.set_title(f"{category} Budget Utilization")
-        fig.autofmt_xdate(rotation=45)
-        ax.tick_params(axis='x', labelsize=9)
-        st.pyplot(fig)
-
+    if category_fig is None:
+        st.info("No budget category data for this project.")
+    else:
+        st.plotly_chart(category_fig, use_container_width=True)
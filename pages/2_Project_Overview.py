@@ -1,58 +1,29 @@
 import streamlit as st
-import json
 import pandas as pd
 import matplotlib.pyplot as plt
-from datetime import datetime
-import sqlite3
-import os
-from utils.openai_client import ask_gpt
-from pipeline.risk_detect import detect_risks
-from pipeline.compare import compare_kpis
+from utils.openai_client import stream_gpt
+from utils.prompting import compact_json
+from utils.db import get_connection
+from utils.snapshot_repo import list_projects, list_snapshots, get_snapshot
 
 st.set_page_config(page_title="📘 Project Overview", layout="wide")
 st.title("🧠 Project Overview Dashboard")
 
-# Ensure DB path exists
-os.makedirs("data", exist_ok=True)
-
 # Connect to SQLite DB
-conn = sqlite3.connect("data/project_data.db", check_same_thread=False)
+conn = get_connection()
 cursor = conn.cursor()
 
-# Load snapshot data from DB
-cursor.execute("""
-    SELECT project_id, report_date, uploaded_at, llm_output
-    FROM files
-    WHERE report_date IS NOT NULL AND llm_output IS NOT NULL
-    ORDER BY project_id, uploaded_at DESC
-""")
-rows = cursor.fetchall()
-
-# --- Map snapshots by project_id ---
-project_map = {}
-for project_id, report_date, uploaded_at, llm_output in rows:
-    if project_id not in project_map:
-        project_map[project_id] = []
-
-    try:
-        parsed_output = json.loads(llm_output)
-        report_date_clean = parsed_output.get("report_date") or report_date or uploaded_at[:10]
-    except Exception:
-        parsed_output = {}
-        report_date_clean = report_date or uploaded_at[:10]
-
-    project_map[project_id].append({
-        "report_date": report_date_clean,
-        "uploaded_at": uploaded_at,
-        "data": parsed_output
-    })
-
-# Sort snapshots by report_date (descending) for each project
-for project_id in project_map:
-    project_map[project_id].sort(key=lambda x: x["report_date"], reverse=True)
+# --- Snapshot metadata per project (bodies are decoded only for the selected snapshots) ---
+def snapshot_index(project_id):
+    """Metadata for a project's snapshots, sorted by report_date (descending)."""
+    entries = [
+        {**entry, "report_date": entry["report_date"] or entry["uploaded_at"][:10]}
+        for entry in list_snapshots(project_id)
+    ]
+    return sorted(entries, key=lambda x: x["report_date"], reverse=True)
 
 # --- Project dropdown options ---
-project_names = sorted(project_map.keys())
+project_names = list_projects()
 
 # --- Streamlit Tabs ---
 tabs = st.tabs(["📝 Executive Summary", "🚨 Risk Dashboard", "🔍 AI Insights Feed"])
@@ -69,9 +40,9 @@ with tabs[0]:
     tone = st.radio("Choose summary tone", ["Formal", "Friendly", "Technical"], horizontal=True)
 
     # Snapshot selection (showing report date + index)
-    snapshots = project_map[selected_project]
+    snapshots = snapshot_index(selected_project)
     snapshot_options = [
-        f"{snap['report_date']}" for i, snap in enumerate(snapshots)
+        f"{snap['report_date']} — index {i}" for i, snap in enumerate(snapshots)
     ]
     selected_snapshots = st.multiselect("Select snapshot(s)", snapshot_options, key="summary_snapshots")
 
@@ -84,7 +55,7 @@ with tabs[0]:
         for option in selected_snapshots:
             try:
                 index = int(option.split("index ")[-1])
-                entry = snapshots[index]["data"]
+                entry, _ = get_snapshot(snapshots[index]["file_id"])
                 if entry:
                     combined_entries.append(entry)
                 else:
@@ -98,23 +69,22 @@ with tabs[0]:
             st.subheader("📂 Combined Snapshot Preview")
             st.json(combined_entries)
 
-            with st.spinner("Generating executive summary..."):
-                prompt = f"""
+            prompt = f"""
 You are a senior analyst assistant. Use a **{tone}** tone to summarize the following project snapshot(s) into a brief executive summary (2–4 sentences), followed by a bullet list of key updates.
 
 Snapshots:
-{json.dumps(combined_entries, indent=2)}
+{compact_json(combined_entries)}
 
 Format your response in Markdown with:
 - One short paragraph at the top (executive summary)
 - Then 3–6 bullet points highlighting notable changes, risks, or progress
 """
-                try:
-                    response = ask_gpt(prompt)
-                    st.subheader("🧠 Executive Summary")
-                    st.markdown(response)
-                except Exception as e:
-                    st.error(f"❌ Failed to generate summary: {e}")
+            try:
+                # Stream tokens as they arrive instead of blocking on the full completion
+                st.subheader("🧠 Executive Summary")
+                st.write_stream(stream_gpt(prompt, call_site="executive_summary"))
+            except Exception as e:
+                st.error(f"❌ Failed to generate summary: {e}")
 
 
 
@@ -123,38 +93,36 @@ with tabs[1]:
     st.subheader("🚨 Project Risk Overview")
     selected_project = st.selectbox("Select a project", project_names, key="risk_project")
 
-    snapshot_options = [f"{snap['report_date']} — index {i}" for i, snap in enumerate(project_map[selected_project])]
+    risk_index = snapshot_index(selected_project)
+    snapshot_options = [f"{snap['report_date']} — index {i}" for i, snap in enumerate(risk_index)]
     selected_snapshots = st.multiselect("Select snapshot(s)", snapshot_options, key="risk_snapshots")
 
     if selected_snapshots:
-        all_risks = []
-        snapshot_risk_counts = []
-        risk_category_counts = {}
-
-        for option in selected_snapshots:
-            index = int(option.split("index ")[-1])
-            snap = project_map[selected_project][index]
-
-            try:
-                # Parse the 'data' field, which contains the LLM output as a JSON string
-                parsed = json.loads(snap["data"])  # 👈 fixed this
-                risks = parsed.get("risks", [])
-                report_date = snap["report_date"]
-
-                snapshot_risk_counts.append({"date": report_date, "count": len(risks)})
-
-                for r in risks:
-                    entry = r.copy()
-                    entry["Snapshot Date"] = report_date
-                    all_risks.append(entry)
-
-                    category = r.get("Risk Category", "Unknown")
-                    risk_category_counts[category] = risk_category_counts.get(category, 0) + 1
-
-            except Exception as e:
-                st.warning(f"❌ Failed to load snapshot {snap.get('report_date', 'Unknown')}: {e}")
-
-        if not all_risks:
+        selected = [
+            risk_index[int(option.split("index ")[-1])]
+            for option in selected_snapshots
+        ]
+        file_ids = [snap["file_id"] for snap in selected]
+        placeholders = ", ".join("?" for _ in file_ids)
+
+        # Aggregate straight from the normalized risks table (no JSON decoding)
+        per_file_counts = dict(cursor.execute(f"""
+            SELECT file_id, COUNT(*) FROM snapshot_risks
+            WHERE file_id IN ({placeholders})
+            GROUP BY file_id
+        """, file_ids).fetchall())
+        risk_category_counts = dict(cursor.execute(f"""
+            SELECT COALESCE(risk_category, 'Unknown'), COUNT(*) FROM snapshot_risks
+            WHERE file_id IN ({placeholders})
+            GROUP BY 1
+        """, file_ids).fetchall())
+
+        snapshot_risk_counts = [
+            {"date": snap["report_date"], "count": per_file_counts.get(snap["file_id"], 0)}
+            for snap in selected
+        ]
+
+        if not sum(per_file_counts.values()):
             st.info("No risks found in selected snapshots.")
             st.stop()
 
@@ -186,7 +154,7 @@ with tabs[2]:
     selected_project = st.selectbox("Select a project", project_names, key="insight_project")
 
     if selected_project:
-        sorted_snapshots = list(reversed(project_map[selected_project]))
+        sorted_snapshots = list(reversed(snapshot_index(selected_project)))
         snapshot_labels = [f"{snap['report_date']} — index {i}" for i, snap in enumerate(sorted_snapshots)]
         selected_options = st.multiselect("Select snapshots to include", snapshot_labels, key="insight_snapshots")
 
@@ -194,16 +162,15 @@ with tabs[2]:
         for option in selected_options:
             index = int(option.split("index ")[-1])
             snap = sorted_snapshots[index]
-            try:
-                parsed_data = json.loads(snap["data"])  # 👈 parse the JSON inside the "data" field
+            parsed_data, error = get_snapshot(snap["file_id"])
+            if error:
+                st.warning(f"⚠️ Skipped malformed snapshot: {error}")
+            else:
                 selected_snapshots.append(parsed_data)
-            except Exception as e:
-                st.warning(f"⚠️ Skipped malformed snapshot: {e}")
 
         if selected_snapshots and st.button("🔍 Generate Insights"):
             st.subheader("📌 GPT Summary Across Selected Snapshots")
-            with st.spinner("Generating insights..."):
-                prompt = f"""
+            prompt = f"""
 You are a cross-project insights generator.
 Given the following snapshots, identify key trends, risks, and changes across the selected project timeline.
 Highlight patterns in budget, scope, sentiment, and risk.
@@ -211,10 +178,9 @@ Highlight patterns in budget, scope, sentiment, and risk.
 Summarize findings in 5–7 bullet points.
 
 Snapshots:
-{json.dumps(selected_snapshots, indent=2)}
+{compact_json(selected_snapshots)}
 """
-                try:
-                    response = ask_gpt(prompt)
-                    st.markdown(response)
-                except Exception as e:
-                    st.error(f"Failed to generate insights: {e}")
+            try:
+                st.write_stream(stream_gpt(prompt, call_site="insights_feed"))
+            except Exception as e:
+                st.error(f"Failed to generate insights: {e}")
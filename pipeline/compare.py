@@ -1,5 +1,8 @@
 import re
 
+# Bump whenever comparison output changes: stored deltas with an older version are recomputed
+COMPARE_VERSION = 1
+
 def extract_budget_number(budget_str):
     # Pull numeric value from string like "$2.3M (80% utilized)"
     match = re.search(r"\$([\d\.]+)([MK]?)", budget_str)
@@ -9,6 +12,33 @@ def extract_budget_number(budget_str):
     multiplier = {"M": 1_000_000, "K": 1_000}.get(suffix.upper(), 1)
     return float(num) * multiplier
 
+# --- Entity keys: how records of each snapshot section are matched across snapshots ---
+def budget_key(item):
+    return item["Category"]
+
+def deliverable_key(deliverable):
+    return deliverable["Deliverable"]
+
+def issue_key(issue):
+    return f"#{issue.get('Issue #')}" if issue.get("Issue #") else (
+        f"{issue.get('Issue Detail', '')}__{issue.get('Issue Creation Date', '')}"
+    )
+
+def task_key(task):
+    return task.get("Task ID") or task.get("Task Name")
+
+def risk_key(risk):
+    # Snapshots store "Risk Name"; older exports used "Risk Name and Description"
+    name = risk.get("Risk Name") or risk.get("Risk Name and Description", "")
+    return f"{name}__{risk.get('Date Identified', '')}"
+
+# --- Fields compared for records present in both snapshots ---
+BUDGET_FIELDS = ["Allotted Budget", "Spent Budget", "Remaining Budget", "Percent Spent", "Notes"]
+DELIVERABLE_FIELDS = ["Start Date", "Date Due", "Status"]
+ISSUE_FIELDS = ["Status", "Owner", "Due Date", "Recommended Action", "Issue Category"]
+SCHEDULE_FIELDS = ["Start Date", "End Date", "Status", "Assigned To"]
+RISK_FIELDS = ["Impact Rating", "Probability Rating", "Risk Category", "Task Area"]
+
 def compare_kpis(current, previous):
     delta = {}
 
@@ -52,11 +82,8 @@ def compare_budget(current, previous):
     - removed categories
     - changed fields per matching category
     """
-    def by_category(lst):
-        return {item["Category"]: item for item in lst}
-
-    curr_map = by_category(current)
-    prev_map = by_category(previous)
+    curr_map = {budget_key(item): item for item in current}
+    prev_map = {budget_key(item): item for item in previous}
 
     all_keys = set(curr_map) | set(prev_map)
     result = {"added": [], "removed": [], "changed": []}
@@ -71,7 +98,7 @@ def compare_budget(current, previous):
             result["removed"].append(prev)
         else:
             changed = {}
-            for field in ["Allotted Budget", "Spent Budget", "Remaining Budget", "Percent Spent", "Notes"]:
+            for field in BUDGET_FIELDS:
                 if curr.get(field) != prev.get(field):
                     changed[field] = (prev.get(field), curr.get(field))
             if changed:
@@ -84,8 +111,8 @@ def compare_deliverables(current, previous):
     Compares deliverables by name.
     Returns added, removed, and changed deliverables.
     """
-    curr_map = {d["Deliverable"]: d for d in current}
-    prev_map = {d["Deliverable"]: d for d in previous}
+    curr_map = {deliverable_key(d): d for d in current}
+    prev_map = {deliverable_key(d): d for d in previous}
 
     all_keys = set(curr_map) | set(prev_map)
     result = {"added": [], "removed": [], "changed": []}
@@ -100,7 +127,7 @@ def compare_deliverables(current, previous):
             result["removed"].append(prev)
         else:
             diff = {}
-            for field in ["Start Date", "Date Due", "Status"]:
+            for field in DELIVERABLE_FIELDS:
                 if curr.get(field) != prev.get(field):
                     diff[field] = (prev.get(field), curr.get(field))
             if diff:
@@ -113,11 +140,6 @@ def compare_issues(current, previous):
     Compares issues using Issue # if available, otherwise uses Issue Detail + Date.
     Returns added, removed, and changed issues.
     """
-    def issue_key(issue):
-        return f"#{issue.get('Issue #')}" if issue.get("Issue #") else (
-            f"{issue.get('Issue Detail', '')}__{issue.get('Issue Creation Date', '')}"
-        )
-
     curr_map = {issue_key(i): i for i in current}
     prev_map = {issue_key(i): i for i in previous}
 
@@ -134,7 +156,7 @@ def compare_issues(current, previous):
             result["removed"].append(prev)
         else:
             diff = {}
-            for field in ["Status", "Owner", "Due Date", "Recommended Action", "Issue Category"]:
+            for field in ISSUE_FIELDS:
                 if curr.get(field) != prev.get(field):
                     diff[field] = (prev.get(field), curr.get(field))
             if diff:
@@ -147,9 +169,6 @@ def compare_schedule(current, previous):
     Compares scheduled tasks using Task ID or Task Name.
     Returns added, removed, and changed tasks.
     """
-    def task_key(task):
-        return task.get("Task ID") or task.get("Task Name")
-
     curr_map = {task_key(t): t for t in current}
     prev_map = {task_key(t): t for t in previous}
 
@@ -166,7 +185,7 @@ def compare_schedule(current, previous):
             result["removed"].append(prev)
         else:
             diff = {}
-            for field in ["Start Date", "End Date", "Status", "Assigned To"]:
+            for field in SCHEDULE_FIELDS:
                 if curr.get(field) != prev.get(field):
                     diff[field] = (prev.get(field), curr.get(field))
             if diff:
@@ -179,9 +198,6 @@ def compare_risks(current, previous):
     Compares risks structurally (for now — detailed risk comparison can evolve later).
     Matches on Risk Name + Date Identified.
     """
-    def risk_key(risk):
-        return f"{risk.get('Risk Name and Description', '')}__{risk.get('Date Identified', '')}"
-
     curr_map = {risk_key(r): r for r in current}
     prev_map = {risk_key(r): r for r in previous}
 
@@ -198,7 +214,7 @@ def compare_risks(current, previous):
             result["removed"].append(prev)
         else:
             diff = {}
-            for field in ["Impact Rating", "Probability Rating", "Risk Category", "Task Area"]:
+            for field in RISK_FIELDS:
                 if curr.get(field) != prev.get(field):
                     diff[field] = (prev.get(field), curr.get(field))
             if diff:
@@ -0,0 +1,121 @@
+# === Whole-history snapshot diff ===
+# Computes compare_snapshots() for every consecutive pair of a project's snapshots in
+# one pass. Each section's records from all snapshots go into a single frame keyed by
+# (snapshot position, entity key); one merge against the same frame shifted by one
+# snapshot pairs every record with its predecessor, and each compared field is checked
+# with one element-wise comparison over all pairs at once.
+#
+# Results equal the pairwise functions in pipeline/compare.py (list order aside, which
+# is unspecified there too).
+
+import numpy as np
+import pandas as pd
+from pipeline.compare import (
+    compare_kpis,
+    budget_key, deliverable_key, issue_key, task_key, risk_key,
+    BUDGET_FIELDS, DELIVERABLE_FIELDS, ISSUE_FIELDS, SCHEDULE_FIELDS, RISK_FIELDS,
+)
+
+# (result key, snapshot section, entity key, compared fields, label of the key in "changed")
+SECTIONS = [
+    ("budget_changes", "budget_details", budget_key, BUDGET_FIELDS, "Category"),
+    ("deliverable_changes", "deliverables", deliverable_key, DELIVERABLE_FIELDS, "Deliverable"),
+    ("issue_changes", "issues", issue_key, ISSUE_FIELDS, "Issue Key"),
+    ("schedule_changes", "schedule", task_key, SCHEDULE_FIELDS, "Task"),
+    ("risk_changes", "risks", risk_key, RISK_FIELDS, "Risk"),
+]
+
+
+def _object_array(values) -> np.ndarray:
+    """1-D object array that keeps None, lists and dicts as elements."""
+    return pd.Series(values, dtype=object).to_numpy()
+
+
+def _section_frame(snapshots, section, key_fn):
+    """One row per record of every snapshot: (snap, key code, row), last duplicate key wins."""
+    snap_ids, keys, records = [], [], []
+    for position, snapshot in enumerate(snapshots):
+        for record in snapshot.get(section, []):
+            snap_ids.append(position)
+            keys.append(key_fn(record))
+            records.append(record)
+
+    # Integer key codes, assigned with dict semantics so keys match exactly as in compare.py's maps
+    index = {}
+    codes = [index.setdefault(key, len(index)) for key in keys]
+    frame = pd.DataFrame({
+        "snap": np.asarray(snap_ids, dtype=np.int64),
+        "key": np.asarray(codes, dtype=np.int64),
+        "row": np.arange(len(records), dtype=np.int64),
+    })
+    frame = frame.drop_duplicates(["snap", "key"], keep="last")
+    return frame, list(index), records
+
+
+def _diff_section(snapshots, section, key_fn, fields, label):
+    pair_count = len(snapshots) - 1
+    results = [{"added": [], "removed": [], "changed": []} for _ in range(pair_count)]
+
+    frame, uniques, records = _section_frame(snapshots, section, key_fn)
+    if frame.empty:
+        return results
+
+    previous = frame.assign(snap=frame["snap"] + 1)
+    merged = frame.merge(previous, on=["snap", "key"], how="outer", suffixes=("_curr", "_prev"), indicator=True)
+    merged = merged[(merged["snap"] >= 1) & (merged["snap"] <= pair_count)]
+
+    # Mirror compare.py's `if not prev` / `elif not curr` (an empty record counts as missing)
+    truthy = np.fromiter((bool(r) for r in records), dtype=bool, count=len(records))
+
+    in_curr = merged["_merge"].isin(["both", "left_only"]).to_numpy()
+    in_prev = merged["_merge"].isin(["both", "right_only"]).to_numpy()
+    curr_rows = np.where(in_curr, merged["row_curr"].fillna(0).to_numpy(dtype=np.int64), 0)
+    prev_rows = np.where(in_prev, merged["row_prev"].fillna(0).to_numpy(dtype=np.int64), 0)
+    curr_ok = in_curr & truthy[curr_rows]
+    prev_ok = in_prev & truthy[prev_rows]
+
+    added = ~prev_ok  # An empty previous record with no current one "adds" None, as in compare.py
+    removed = prev_ok & ~curr_ok
+    both = curr_ok & prev_ok
+    pair_index = merged["snap"].to_numpy(dtype=np.int64) - 1
+
+    for i, row, present in zip(pair_index[added].tolist(), curr_rows[added].tolist(), in_curr[added].tolist()):
+        results[i]["added"].append(records[row] if present else None)
+    for i, row in zip(pair_index[removed].tolist(), prev_rows[removed].tolist()):
+        results[i]["removed"].append(records[row])
+
+    if both.any():
+        both_curr, both_prev = curr_rows[both], prev_rows[both]
+        diffs = {}
+        for field in fields:
+            values = _object_array([r.get(field) for r in records])
+            currents, prevs = values[both_curr], values[both_prev]
+            # Element-wise Python `!=` (None == None, nan != nan, 1 == 1.0), as in compare.py
+            changed = np.flatnonzero(np.not_equal(currents, prevs).astype(bool))
+            for j in changed.tolist():
+                diffs.setdefault(j, {})[field] = (prevs[j], currents[j])
+
+        keys, both_pairs = merged.loc[both, "key"].tolist(), pair_index[both].tolist()
+        for j in sorted(diffs):
+            results[both_pairs[j]]["changed"].append({label: uniques[keys[j]], "diff": diffs[j]})
+
+    return results
+
+
+def diff_history(snapshots: list) -> list:
+    """
+    Diffs every consecutive pair of `snapshots` (oldest first).
+    Returns len(snapshots) - 1 results; result i equals
+    compare_snapshots(snapshots[i + 1], snapshots[i]).
+    """
+    if len(snapshots) < 2:
+        return []
+
+    results = [
+        {"kpi_changes": compare_kpis(current.get("kpis", {}), previous.get("kpis", {}))}
+        for previous, current in zip(snapshots, snapshots[1:])
+    ]
+    for result_key, section, key_fn, fields, label in SECTIONS:
+        for result, section_result in zip(results, _diff_section(snapshots, section, key_fn, fields, label)):
+            result[result_key] = section_result
+    return results
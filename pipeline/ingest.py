@@ -0,0 +1,306 @@
+# === Batch Document Ingestion ===
+# Parses uploaded files in a worker pool, then runs the structured-output LLM
+# extraction with bounded concurrency. Long documents are split into structural chunks
+# that are extracted concurrently and merged (map-reduce) instead of being truncated.
+# Files that revise an earlier file of the same batch (later report_date) wait for it,
+# so the snapshot chain keeps its order.
+
+import os
+import queue
+import asyncio
+import contextlib
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from utils.parser_registry import parse_uploaded_file, resolve_extension
+from utils.openai_client import ask_gpt_json_async, submit_async, MAX_CONCURRENCY
+from utils.json_schema import schema_from_example
+from utils.prompting import compact_json, split_into_chunks
+from pipeline.snapshot_merge import merge_partial_snapshots
+from utils.snapshot_store import content_hash, find_by_content_hash, load_snapshot
+
+PARSE_WORKERS = int(os.getenv("INGEST_PARSE_WORKERS", str(min(8, (os.cpu_count() or 2) * 2))))
+
+# Shape of a document snapshot; the structured-output schema is derived from it
+EXAMPLE_JSON_FORMAT = {
+    "report_date": "2025-07-31",
+    "source": "document",
+    "summary": None,
+    "kpis": {
+        "budget": None,
+        "timeline": None,
+        "scope": None,
+        "client_sentiment": None,
+        "allotted_budget": None,
+        "spent_budget": None,
+        "remaining_budget": None,
+        "percent_spent": None
+    },
+    "schedule": [
+        {
+            "Task ID": "",
+            "Task Name": "",
+            "Description": "",
+            "Assigned To": "",
+            "Start Date": "",
+            "End Date": "",
+            "Duration (Days)": 0,
+            "Status": "",
+            "Dependencies": ""
+        }
+    ],
+    "issues": [
+        {
+            "Issue #": "",
+            "Issue Creation Date": "",
+            "Issue Category": "",
+            "Issue Detail": "",
+            "Recommended Action": "",
+            "Owner": "",
+            "Status": "",
+            "Due Date": "",
+            "Resolution": ""
+        }
+    ],
+    "risks": [
+        {
+            "ID": "",
+            "Division": "",
+            "Task Area": "",
+            "Risk Name": "",
+            "Risk Description": "",
+            "Risk Category": "",
+            "Probability Rating": 0,
+            "Impact Rating": 0,
+            "Risk Rating": 0,
+            "Impact If Not Mitigated": "",
+            "Action/Mitigation Strategy": "",
+            "Mitigation Owner(s)": "",
+            "Action Taken?": "",
+            "Date Identified": ""
+        }
+    ],
+    "deliverables": [
+        {
+            "Deliverable": "",
+            "Status": "",
+            "Start Date": "",
+            "Date Due": ""
+        }
+    ],
+    "budget_details": [
+        {
+            "Category": "",
+            "Allotted Budget": 0.0,
+            "Spent Budget": 0.0,
+            "Remaining Budget": 0.0,
+            "Percent Spent": 0.0,
+            "Notes": None
+        }
+    ]
+}
+
+SNAPSHOT_SCHEMA = schema_from_example(EXAMPLE_JSON_FORMAT)
+
+
+def fetch_previous_snapshot(conn, project_id, report_date):
+    """
+    Returns (report_date, snapshot) of the latest stored snapshot before report_date,
+    or (None, {}) if the project has none.
+    """
+    row = conn.execute("""
+        SELECT report_date, id FROM files
+        WHERE project_id = ? AND report_date < ?
+        ORDER BY report_date DESC
+        LIMIT 1
+    """, (project_id, report_date)).fetchone()
+    if not row:
+        return None, {}
+    return row[0], load_snapshot(conn, row[1])
+
+
+def build_revise_prompt(previous_llm_output: dict, raw_text: str, part: int = 1, parts: int = 1) -> str:
+    part_note = ""
+    if parts > 1:
+        part_note = f"""
+The document is long and is processed in parts: this is part {part} of {parts}. Apply only the updates stated in this part; keep everything it does not mention exactly as in the current snapshot.
+"""
+    return f"""
+You are a project analyst. You are given two inputs:
+1. The current full project snapshot (in JSON format)
+2. A new document containing updated project information
+
+Your job is to revise the current snapshot. Overwrite any values in the JSON **only if the new document explicitly updates or corrects them**. You may also **append any new risks, issues, deliverables, or schedule items** mentioned in the document, if they do not already exist in the JSON.
+
+DO NOT delete or null out anything unless the document explicitly says it is removed. If the document provides no new information on a field, leave the previous value as is.
+{part_note}
+Return the full revised snapshot.
+
+--- CURRENT PROJECT SNAPSHOT ---
+{compact_json(previous_llm_output)}
+
+--- NEW DOCUMENT TEXT ---
+{raw_text.strip()}
+"""
+
+
+async def extract_snapshot(previous_llm_output: dict, raw_text: str, semaphore: asyncio.Semaphore | None = None) -> dict:
+    """
+    Revises the previous snapshot with the new document text using structured-output
+    calls validated against SNAPSHOT_SCHEMA: one call per chunk of the document, run
+    concurrently (bounded by `semaphore` if given), then merged in document order.
+    Raises ValueError if any model output does not match the schema.
+    """
+    chunks = split_into_chunks(raw_text) or [""]
+
+    async def revise(part, chunk):
+        async with semaphore or contextlib.nullcontext():
+            return await ask_gpt_json_async(
+                build_revise_prompt(previous_llm_output, chunk, part, len(chunks)),
+                schema=SNAPSHOT_SCHEMA,
+                schema_name="project_snapshot",
+                call_site="upload_extract"
+            )
+
+    revisions = await asyncio.gather(*(revise(part, chunk) for part, chunk in enumerate(chunks, start=1)))
+    return merge_partial_snapshots(previous_llm_output, list(revisions))
+
+
+def ingest_batch(conn, project_id, uploaded_files, on_progress=None,
+                 max_workers: int = PARSE_WORKERS, max_concurrency: int = MAX_CONCURRENCY) -> list:
+    """
+    Parses and extracts snapshots for a batch of uploaded files.
+
+    Returns one result dict per file, in upload order:
+    {"name", "file_type", "raw_text", "parsed", "report_date", "structured", "error",
+     "content_hash", "duplicate_of"}
+
+    Files whose bytes are already stored for the project (or repeat an earlier file of
+    the batch) are not parsed or sent to the LLM: their result reuses the stored / first
+    copy and "duplicate_of" names it.
+
+    on_progress(index, name, stage) is always called from the calling thread (also for
+    the extraction stages, which run on the background loop) with stage in
+    "parsing", "parsed", "extracting", "done", "duplicate" or "failed".
+    """
+    def notify(index, stage):
+        if on_progress:
+            on_progress(index, results[index]["name"], stage)
+
+    results = [{
+        "name": f.name,
+        "file_type": resolve_extension(f.name, getattr(f, "type", None)) or f.name.split(".")[-1].lower(),
+        "raw_text": "",
+        "parsed": {},
+        "report_date": None,
+        "structured": None,
+        "error": None,
+        "content_hash": content_hash(f.getvalue()),
+        "duplicate_of": None,
+    } for f in uploaded_files]
+
+    # --- Stage 0: content-hash deduplication ---
+    to_process = []
+    batch_twins = {}  # index -> index of the first identical file in this batch
+    first_by_hash = {}
+    for index, result in enumerate(results):
+        digest = result["content_hash"]
+        if digest in first_by_hash:
+            batch_twins[index] = first_by_hash[digest]
+            continue
+        first_by_hash[digest] = index
+
+        stored = find_by_content_hash(conn, digest, project_id=project_id)
+        if stored:
+            result.update({
+                "raw_text": stored["raw_text"],
+                "parsed": stored["metadata"],
+                "report_date": stored["report_date"],
+                "structured": stored["snapshot"],
+                "duplicate_of": stored["file_id"],
+            })
+            notify(index, "duplicate")
+        else:
+            to_process.append(index)
+
+    # --- Stage 1: parse in a worker pool ---
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        futures = {}
+        for index in to_process:
+            notify(index, "parsing")
+            futures[pool.submit(parse_uploaded_file, uploaded_files[index])] = index
+
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                results[index]["error"] = f"Parsing failed: {e}"
+                notify(index, "failed")
+                continue
+
+            parsed = result.get("parsed", {}) or {}
+            results[index]["raw_text"] = result.get("raw_text", "")
+            results[index]["parsed"] = parsed
+            results[index]["report_date"] = parsed.get("report_date") or datetime.today().strftime("%Y-%m-%d")
+            notify(index, "parsed")
+
+    # --- Stage 2: LLM extraction, one wave per report_date (oldest first) ---
+    # Files sharing a report_date revise the same base and run concurrently; a later
+    # wave revises the newest snapshot produced so far (batch or database).
+    waves = {}
+    for index in to_process:
+        if results[index]["error"] is None:
+            waves.setdefault(results[index]["report_date"], []).append(index)
+
+    # The waves run on the background event loop; stage events are queued there and
+    # passed to on_progress on this thread (Streamlit ignores UI calls from other threads)
+    events = queue.Queue()
+
+    async def process(index, base_snapshot, semaphore):
+        events.put((index, "extracting"))
+        try:
+            results[index]["structured"] = await extract_snapshot(base_snapshot, results[index]["raw_text"], semaphore)
+            events.put((index, "done"))
+        except Exception as e:
+            results[index]["error"] = str(e)
+            events.put((index, "failed"))
+
+    async def run_waves():
+        # One limit shared by every chunk of every file
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+        batch_base = None  # (report_date, snapshot) of the newest extracted file so far
+        for report_date in sorted(waves):
+            db_date, db_snapshot = fetch_previous_snapshot(conn, project_id, report_date)
+            if batch_base and (db_date is None or batch_base[0] >= db_date):
+                base_snapshot = batch_base[1]
+            else:
+                base_snapshot = db_snapshot
+
+            indices = waves[report_date]
+            await asyncio.gather(*(process(i, base_snapshot, semaphore) for i in indices))
+
+            # Last successful file of the wave (upload order) is the base for the next one
+            for i in reversed(indices):
+                if results[i]["structured"] is not None:
+                    batch_base = (report_date, results[i]["structured"])
+                    break
+
+    if waves:
+        future = submit_async(run_waves())
+        while not (future.done() and events.empty()):
+            try:
+                notify(*events.get(timeout=0.1))
+            except queue.Empty:
+                pass
+        future.result()
+
+    # --- Repeats within the batch mirror their first copy ---
+    for index, first in batch_twins.items():
+        twin = results[first]
+        results[index].update({
+            key: twin[key] for key in ("raw_text", "parsed", "report_date", "structured", "error")
+        })
+        results[index]["duplicate_of"] = twin["duplicate_of"] or twin["name"]
+        notify(index, "failed" if twin["error"] else "duplicate")
+
+    return results
@@ -3,9 +3,11 @@
 # Each entry matches the expected structure in llm_output["risks"].
 # All fields are returned and ready for user review or system ingestion.
 
-from datetime import date
+from datetime import date, datetime
+import hashlib
 import json
 from utils.openai_client import ask_gpt
+from utils.prompting import compact_json
 
 def detect_risks(current_snapshot: dict, delta_summary: dict) -> list | dict:
     """
@@ -27,12 +29,12 @@ def detect_risks(current_snapshot: dict, delta_summary: dict) -> list | dict:
         # Prepare prompt inputs
         current_kpis = current_snapshot.get("kpis", {})
         current_risks = current_snapshot.get("risks", [])
-        current_kpis_json = json.dumps(current_kpis, indent=2)
-        delta_summary_json = json.dumps(delta_summary, indent=2)
-        current_risks_json = json.dumps([
+        current_kpis_json = compact_json(current_kpis)
+        delta_summary_json = compact_json(delta_summary)
+        current_risks_json = compact_json([
             r.get("Risk Name and Description", "")
             for r in current_risks
-        ], indent=2)
+        ])
 
         today_str = date.today().isoformat()
 
@@ -82,11 +84,8 @@ Your task is to suggest **new and realistic risks** based on:
 Return only a clean JSON list (no Markdown, no comments).
 """
 
-        # GPT response
-        response = ask_gpt(prompt)
-
-        if not response or "Azure GPT ERROR" in response:
-            raise ValueError(f"No response returned from GPT: {response or 'empty'}")
+        # GPT response (raises LLMError if the call fails after retries)
+        response = ask_gpt(prompt, call_site="detect_risks")
 
         # Strip markdown formatting if present
         cleaned = response.strip()
@@ -98,6 +97,7 @@ Return only a clean JSON list (no Markdown, no comments).
     except Exception as e:
         return {
             "error": str(e),
+            "error_type": type(e).__name__,
             "raw_response": response if 'response' in locals() else "No response"
         }
 
@@ -128,7 +128,7 @@ Broken Input:
 """
 
     try:
-        response = ask_gpt(prompt)
+        response = ask_gpt(prompt, call_site="detect_risks_repair")
 
         cleaned = response.strip()
         if cleaned.startswith("```"):
@@ -142,3 +142,66 @@ Broken Input:
             "error": f"Failed to fix risk JSON: {e}",
             "raw_input": risks_raw
         }
+
+
+# === Risk Cache (risk_cache table) ===
+# Suggestions are memoized per snapshot pair so Streamlit reruns cost no LLM calls.
+
+def snapshot_pair_hash(current_snapshot: dict, previous_snapshot: dict, delta_summary: dict) -> str:
+    """
+    Content hash of both snapshots and their KPI delta.
+    Any edit to either snapshot produces a new key, so stale entries are never served.
+    """
+    payload = json.dumps(
+        {"current": current_snapshot, "previous": previous_snapshot, "delta": delta_summary},
+        sort_keys=True, default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def detect_risks_cached(conn, project_id, current_snapshot, previous_snapshot, delta_summary,
+                        current_date=None, previous_date=None) -> list | dict:
+    """
+    Same output as detect_risks(), read through the risk_cache table.
+    Only successful (list) results are stored; errors are retried on the next run.
+    """
+    pair_hash = snapshot_pair_hash(current_snapshot, previous_snapshot, delta_summary)
+
+    row = conn.execute(
+        "SELECT risk_json FROM risk_cache WHERE snapshot_pair_hash = ?",
+        (pair_hash,)
+    ).fetchone()
+    if row:
+        try:
+            return json.loads(row[0])
+        except Exception:
+            pass  # Corrupt entry — regenerate below
+
+    risks = detect_risks(current_snapshot=current_snapshot, delta_summary=delta_summary)
+
+    if isinstance(risks, list):
+        # NOTE: "current_date" must be quoted, unquoted it is SQLite's CURRENT_DATE keyword
+        conn.execute("""
+            INSERT OR REPLACE INTO risk_cache
+            (project_id, "current_date", previous_date, snapshot_pair_hash, risk_json, generated_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (
+            project_id, current_date, previous_date, pair_hash,
+            json.dumps(risks), datetime.now().isoformat()
+        ))
+        conn.commit()
+
+    return risks
+
+
+def invalidate_risk_cache(conn, project_id, report_date):
+    """
+    Drops cached suggestions for every pair that involves the given snapshot.
+    Call whenever a snapshot is (re-)saved.
+    """
+    # "current_date" quoted for the same reason as in detect_risks_cached()
+    conn.execute("""
+        DELETE FROM risk_cache
+        WHERE project_id = ? AND ("current_date" = ? OR previous_date = ?)
+    """, (project_id, report_date, report_date))
+    conn.commit()
@@ -0,0 +1,118 @@
+# === Persisted snapshot deltas (snapshot_deltas table) ===
+# compare_snapshots() output for each pair of consecutive snapshots of a project
+# (consecutive by upload time, as the History page orders them), keyed by
+# (previous_file_id, current_file_id). Written when a snapshot is saved, read by the
+# dashboard and risk detection, and recomputed lazily if missing or produced by an
+# older COMPARE_VERSION.
+#
+# Rebuild every stored delta after changing the compare logic:
+#     python -m pipeline.snapshot_deltas [--project PROJECT_ID]
+
+import json
+import argparse
+from datetime import datetime
+from pipeline.compare import compare_snapshots, COMPARE_VERSION
+from pipeline.history_diff import diff_history
+from utils.snapshot_store import load_snapshot, load_snapshots
+
+
+def _ordered_snapshots(conn, project_id) -> list:
+    """[(file_id, snapshot), ...] of a project, oldest upload first; undecodable rows are skipped."""
+    file_ids = [r[0] for r in conn.execute("""
+        SELECT id FROM files
+        WHERE project_id = ? AND report_date IS NOT NULL AND llm_output IS NOT NULL
+        ORDER BY uploaded_at
+    """, (project_id,)).fetchall()]
+    bodies = load_snapshots(conn, file_ids)
+    return [(file_id, bodies[file_id][0]) for file_id in file_ids if bodies[file_id][0] is not None]
+
+
+def _store(conn, project_id, previous_file_id, current_file_id, delta):
+    conn.execute("""
+        INSERT OR REPLACE INTO snapshot_deltas
+        (previous_file_id, current_file_id, project_id, compare_version, delta_json, computed_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, (
+        previous_file_id, current_file_id, project_id, COMPARE_VERSION,
+        json.dumps(delta, default=str), datetime.now().isoformat()
+    ))
+
+
+def get_delta(conn, project_id, previous_file_id, current_file_id, previous_snapshot=None, current_snapshot=None) -> dict:
+    """
+    The stored compare_snapshots(current, previous) result for this pair. A missing or
+    outdated row is computed from the given snapshots (or the files table) and stored.
+    """
+    row = conn.execute("""
+        SELECT compare_version, delta_json FROM snapshot_deltas
+        WHERE previous_file_id = ? AND current_file_id = ?
+    """, (previous_file_id, current_file_id)).fetchone()
+    if row and row[0] == COMPARE_VERSION:
+        try:
+            return json.loads(row[1])
+        except Exception:
+            pass  # Corrupt entry — recompute below
+
+    if previous_snapshot is None or current_snapshot is None:
+        previous_snapshot = load_snapshot(conn, previous_file_id)
+        current_snapshot = load_snapshot(conn, current_file_id)
+
+    delta = compare_snapshots(current_snapshot, previous_snapshot)
+    _store(conn, project_id, previous_file_id, current_file_id, delta)
+    conn.commit()
+    # Same JSON round trip as a stored read, so callers always see the same shapes
+    return json.loads(json.dumps(delta, default=str))
+
+
+def update_snapshot_deltas(conn, project_id, file_id) -> None:
+    """
+    Call whenever a snapshot is (re-)saved: drops every delta involving it and stores
+    the deltas against its neighbours in upload order.
+    """
+    conn.execute(
+        "DELETE FROM snapshot_deltas WHERE previous_file_id = ? OR current_file_id = ?",
+        (file_id, file_id)
+    )
+    conn.commit()  # Stale deltas stay gone even if computing the new ones fails
+    snapshots = _ordered_snapshots(conn, project_id)
+    ids = [fid for fid, _ in snapshots]
+    if file_id in ids:
+        position = ids.index(file_id)
+        for prev_pos, curr_pos in ((position - 1, position), (position, position + 1)):
+            if prev_pos >= 0 and curr_pos < len(snapshots):
+                (prev_id, prev_snapshot), (curr_id, curr_snapshot) = snapshots[prev_pos], snapshots[curr_pos]
+                _store(conn, project_id, prev_id, curr_id, compare_snapshots(curr_snapshot, prev_snapshot))
+    conn.commit()
+
+
+def recompute_deltas(conn, project_id=None) -> int:
+    """
+    Rebuilds the stored deltas of one project (or all) from scratch with diff_history().
+    Returns the number of deltas written.
+    """
+    if project_id is None:
+        project_ids = [r[0] for r in conn.execute("SELECT DISTINCT project_id FROM files").fetchall()]
+    else:
+        project_ids = [project_id]
+
+    written = 0
+    for pid in project_ids:
+        snapshots = _ordered_snapshots(conn, pid)
+        conn.execute("DELETE FROM snapshot_deltas WHERE project_id = ?", (pid,))
+        deltas = diff_history([snapshot for _, snapshot in snapshots])
+        for (prev_id, _), (curr_id, _), delta in zip(snapshots, snapshots[1:], deltas):
+            _store(conn, pid, prev_id, curr_id, delta)
+        conn.commit()
+        written += len(deltas)
+    return written
+
+
+if __name__ == "__main__":
+    from utils.db import get_connection
+
+    parser = argparse.ArgumentParser(description="Recompute stored snapshot deltas.")
+    parser.add_argument("--project", help="Only this project id (default: every project)")
+    args = parser.parse_args()
+
+    count = recompute_deltas(get_connection(), args.project)
+    print(f"Recomputed {count} snapshot deltas (compare version {COMPARE_VERSION}).")
@@ -0,0 +1,129 @@
+# === Deterministic merge of per-chunk snapshot revisions ===
+# Each chunk of a long document revises the same base snapshot independently. The
+# revisions are merged field by field: a value counts as an update only when it is
+# non-empty and differs from the base, later chunks (document order) win conflicts, and
+# records are matched by the same entity keys compare.py uses, so the result does not
+# depend on completion order. Empty values (None / "" / [] / {}) never overwrite: the
+# strict schema makes every chunk emit every key, and the prompt's base is pruned of
+# empty fields, so a null usually just means "not mentioned in this chunk".
+#
+# Self-check: python -m pipeline.snapshot_merge
+
+import json
+import math
+from pipeline.compare import budget_key, deliverable_key, issue_key, task_key, risk_key
+
+ENTITY_KEYS = {
+    "budget_details": budget_key,
+    "deliverables": deliverable_key,
+    "issues": issue_key,
+    "schedule": task_key,
+    "risks": risk_key,
+}
+
+
+def _keyed(records, key_fn) -> dict:
+    """Maps (entity key, occurrence) -> record, keeping list order and duplicate keys."""
+    keyed = {}
+    seen = {}
+    for record in records or []:
+        if not isinstance(record, dict):
+            continue
+        try:
+            key = key_fn(record)
+        except Exception:
+            key = None
+        if key in (None, ""):
+            key = json.dumps(record, sort_keys=True, default=str)
+        occurrence = seen.get(key, 0)
+        seen[key] = occurrence + 1
+        keyed[(key, occurrence)] = record
+    return keyed
+
+
+def _is_empty(value) -> bool:
+    if value is None:
+        return True
+    if isinstance(value, float) and math.isnan(value):
+        return True
+    return isinstance(value, (str, list, dict)) and len(value) == 0
+
+
+def _merge_fields(base: dict, revisions: list) -> dict:
+    merged = dict(base)
+    for revision in revisions:
+        for field, value in revision.items():
+            if _is_empty(value):
+                merged.setdefault(field, value)  # Keep the key, never the blank over a value
+            elif field not in base or base[field] != value:
+                merged[field] = value
+    return merged
+
+
+def _merge_records(base_records, revisions, key_fn) -> list:
+    base = _keyed(base_records, key_fn)
+    revised = [_keyed(records, key_fn) for records in revisions]
+
+    merged = []
+    for key, record in base.items():
+        present = [r[key] for r in revised if key in r]
+        if not present:
+            continue  # Every chunk dropped it: treat as an explicit removal
+        merged.append(_merge_fields(record, present))
+
+    # New records in order of first appearance; later chunks refine them
+    new_keys = []
+    for r in revised:
+        new_keys.extend(k for k in r if k not in base and k not in new_keys)
+    for key in new_keys:
+        present = [r[key] for r in revised if key in r]
+        merged.append(_merge_fields(present[0], present[1:]))
+    return merged
+
+
+def merge_partial_snapshots(base: dict, revisions: list) -> dict:
+    """
+    Merges full-snapshot revisions of `base` (one per document chunk, in document order)
+    into a single snapshot.
+    """
+    if not revisions:
+        return base
+    if len(revisions) == 1:
+        return revisions[0]
+
+    merged = {}
+    fields = list(base) + [f for r in revisions for f in r if f not in base]
+    for field in dict.fromkeys(fields):
+        base_value = base.get(field)
+        present = [r[field] for r in revisions if field in r]
+
+        if field in ENTITY_KEYS:
+            merged[field] = _merge_records(base_value, present, ENTITY_KEYS[field])
+        elif isinstance(base_value, dict) or (base_value is None and present and all(isinstance(v, dict) for v in present)):
+            merged[field] = _merge_fields(base_value or {}, [v for v in present if isinstance(v, dict)])
+        else:
+            merged[field] = base_value
+            for value in present:
+                if not _is_empty(value) and value != base_value:
+                    merged[field] = value
+    return merged
+
+
+if __name__ == "__main__":
+    # A later chunk's nulls must not erase what an earlier chunk extracted
+    merged = merge_partial_snapshots({}, [
+        {"summary": "First half", "kpis": {"budget": "$1M"}, "schedule": [{"Task ID": "T1", "Status": "Done"}]},
+        {"summary": None, "kpis": {"budget": None, "scope": None}, "schedule": [{"Task ID": "T1", "Status": None}]},
+    ])
+    assert merged["summary"] == "First half", merged
+    assert merged["kpis"] == {"budget": "$1M", "scope": None}, merged
+    assert merged["schedule"] == [{"Task ID": "T1", "Status": "Done"}], merged
+
+    # "" in the base is pruned from the prompt; a null answer for it is not an update
+    base = {"kpis": {"budget": "", "scope": "Unchanged"}}
+    merged = merge_partial_snapshots(base, [
+        {"kpis": {"budget": None, "scope": "Scope Widened"}},
+        {"kpis": {"budget": None, "scope": None}},
+    ])
+    assert merged["kpis"] == {"budget": "", "scope": "Scope Widened"}, merged
+    print("snapshot_merge self-check passed")
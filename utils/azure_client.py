@@ -0,0 +1,141 @@
+# === Process-wide Azure OpenAI clients ===
+# Clients are created on first use (importing this module does not import openai) and
+# shared by every page, rerun and pipeline module of the Streamlit server process. Both
+# sit on an explicitly configured httpx connection pool with keep-alive and timeouts, so
+# consecutive LLM calls reuse warm TLS connections. Async calls run on one long-lived
+# background event loop for the same reason. Everything is closed at interpreter exit.
+#
+# Kept apart from utils/openai_client.py so that editing prompts / call helpers (which
+# Streamlit hot-reloads) does not rebuild the clients.
+
+import os
+import atexit
+import asyncio
+import threading
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Azure-specific config
+endpoint = os.getenv("ENDPOINT_URL", "https://ppiproj-resource.services.ai.azure.com/api/projects/ppiproj")
+deployment = os.getenv("DEPLOYMENT_NAME", "o4-mini")
+subscription_key = os.getenv("AZURE_OPENAI_API_KEY", "REPLACE_WITH_YOUR_KEY_VALUE_HERE")
+api_version = os.getenv("AZURE_API_VERSION", "2025-01-01-preview")
+
+# HTTP connection pool + timeouts
+HTTP_MAX_CONNECTIONS = int(os.getenv("AZURE_HTTP_MAX_CONNECTIONS", "20"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("AZURE_HTTP_MAX_KEEPALIVE", "10"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("AZURE_HTTP_KEEPALIVE_EXPIRY", "60"))
+CONNECT_TIMEOUT = float(os.getenv("AZURE_CONNECT_TIMEOUT", "10"))
+READ_TIMEOUT = float(os.getenv("AZURE_READ_TIMEOUT", "600"))  # Reasoning models can think for minutes
+MAX_RETRIES = int(os.getenv("AZURE_MAX_RETRIES", "0"))  # Retries are scheduled by utils/llm_scheduler.py
+
+_lock = threading.Lock()
+_client = None
+_async_client = None
+_loop = None
+_loop_thread = None
+
+
+def _http_settings():
+    import httpx
+    limits = httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+    )
+    timeout = httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT)
+    return httpx, limits, timeout
+
+
+def get_client():
+    """The shared synchronous AzureOpenAI client (created on first use)."""
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                from openai import AzureOpenAI
+                httpx, limits, timeout = _http_settings()
+                _client = AzureOpenAI(
+                    azure_endpoint=endpoint,
+                    api_key=subscription_key,
+                    api_version=api_version,
+                    timeout=timeout,
+                    max_retries=MAX_RETRIES,
+                    http_client=httpx.Client(limits=limits, timeout=timeout),
+                )
+    return _client
+
+
+def _get_loop():
+    """Background event loop that owns the shared async client's connections."""
+    global _loop, _loop_thread
+    with _lock:
+        if _loop is None or _loop.is_closed():
+            _loop = asyncio.new_event_loop()
+            _loop_thread = threading.Thread(target=_loop.run_forever, name="azure-openai-loop", daemon=True)
+            _loop_thread.start()
+        return _loop
+
+
+def get_async_client():
+    """
+    The shared AsyncAzureOpenAI client. Its connections belong to the background loop,
+    so it must be used from coroutines started with run_async().
+    """
+    global _async_client
+    if asyncio.get_running_loop() is not _loop:
+        raise RuntimeError("Async LLM calls must run through run_async().")
+    if _async_client is None:
+        from openai import AsyncAzureOpenAI
+        httpx, limits, timeout = _http_settings()
+        _async_client = AsyncAzureOpenAI(
+            azure_endpoint=endpoint,
+            api_key=subscription_key,
+            api_version=api_version,
+            timeout=timeout,
+            max_retries=MAX_RETRIES,
+            http_client=httpx.AsyncClient(limits=limits, timeout=timeout),
+        )
+    return _async_client
+
+
+def submit_async(coro):
+    """
+    Schedules a coroutine on the background loop and returns its concurrent.futures.Future,
+    so the calling thread can keep working (e.g. update the UI) while it runs.
+    """
+    loop = _get_loop()
+    if threading.current_thread() is _loop_thread:
+        raise RuntimeError("run_async() cannot be called from inside a coroutine it is running.")
+    return asyncio.run_coroutine_threadsafe(coro, loop)
+
+
+def run_async(coro):
+    """
+    Runs a coroutine to completion on the background loop from synchronous (Streamlit /
+    worker thread) code and returns its result.
+    """
+    return submit_async(coro).result()
+
+
+def close_clients() -> None:
+    """Closes the pooled connections and stops the background loop."""
+    global _client, _async_client, _loop
+    with _lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+        if _loop is not None and not _loop.is_closed():
+            if _async_client is not None:
+                try:
+                    asyncio.run_coroutine_threadsafe(_async_client.close(), _loop).result(timeout=5)
+                except Exception:
+                    pass  # Best effort at shutdown
+            _loop.call_soon_threadsafe(_loop.stop)
+        _async_client = None
+        _loop = None
+
+
+atexit.register(close_clients)
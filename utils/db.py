@@ -0,0 +1,180 @@
+# === Database connection + versioned schema migrations ===
+# Every entry point (Project_Manager and the pages) connects through get_connection(),
+# which brings the schema up to date once per process. The applied version is kept in
+# SQLite's PRAGMA user_version.
+
+import os
+import sqlite3
+import threading
+from utils.snapshot_tables import (
+    create_snapshot_tables, backfill_snapshot_tables, create_timeseries_tables, coerce_timeseries_numbers
+)
+from utils.snapshot_store import encode_snapshot_history, backfill_timeseries
+from utils.storage_codec import migrate_legacy_rows
+
+DB_PATH = os.path.join("data", "project_data.db")
+
+_migrated_paths = set()
+_migration_lock = threading.Lock()
+
+
+def _create_base_tables(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS projects (
+        id TEXT PRIMARY KEY,
+        name TEXT,
+        issuer TEXT,
+        start_date TEXT,
+        summary TEXT,
+        contacts TEXT,
+        tags TEXT,
+        rfp_file TEXT,
+        status TEXT DEFAULT 'active',
+        created_at TEXT
+    )
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS files (
+        id TEXT PRIMARY KEY,
+        project_id TEXT,
+        filename TEXT,
+        file_type TEXT,
+        snapshot_date TEXT,
+        report_date TEXT,
+        uploaded_at TEXT,
+        llm_output TEXT,
+        FOREIGN KEY(project_id) REFERENCES projects(id)
+    )
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS risk_cache (
+        project_id TEXT,
+        current_date TEXT,
+        previous_date TEXT,
+        snapshot_pair_hash TEXT PRIMARY KEY,
+        risk_json TEXT,
+        generated_at TEXT
+    )
+    ''')
+
+
+def _column_names(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})").fetchall()}
+
+
+def add_column_if_missing(conn, table, column, sql_type):
+    if column not in _column_names(conn, table):
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {sql_type}")
+
+
+def _add_document_columns(conn):
+    # The document Save path writes raw_text + metadata, which the original CREATE TABLE lacked
+    add_column_if_missing(conn, "files", "raw_text", "TEXT")
+    add_column_if_missing(conn, "files", "metadata", "TEXT")
+
+
+def _add_files_indexes(conn):
+    # Serves "WHERE project_id = ? AND report_date < ? ORDER BY report_date DESC LIMIT 1"
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_files_project_report ON files(project_id, report_date)")
+    # Serves "ORDER BY project_id, uploaded_at DESC" and uploaded_at lookups per project
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_files_project_uploaded ON files(project_id, uploaded_at DESC)")
+
+
+def _add_content_hash(conn):
+    # Upload deduplication: identical bytes are recognised by hash instead of re-parsed
+    add_column_if_missing(conn, "files", "content_hash", "TEXT")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_files_content_hash ON files(content_hash)")
+
+
+def _create_normalized_tables(conn):
+    create_snapshot_tables(conn)
+    backfill_snapshot_tables(conn)
+
+
+def _create_snapshot_deltas(conn):
+    # compare_snapshots() output per consecutive snapshot pair (see pipeline/snapshot_deltas.py)
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS snapshot_deltas (
+        previous_file_id TEXT NOT NULL,
+        current_file_id TEXT NOT NULL,
+        project_id TEXT,
+        compare_version INTEGER,
+        delta_json TEXT,
+        computed_at TEXT,
+        PRIMARY KEY (previous_file_id, current_file_id)
+    )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_snapshot_deltas_current ON snapshot_deltas(current_file_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_snapshot_deltas_project ON snapshot_deltas(project_id)")
+
+
+def _add_snapshot_deltas_encoding(conn):
+    # Delta-encoded snapshot storage (see utils/snapshot_store.py); existing rows are re-encoded
+    add_column_if_missing(conn, "files", "snapshot_base", "TEXT")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_files_snapshot_base ON files(snapshot_base)")
+    encode_snapshot_history(conn)
+
+
+def _create_timeseries_tables(conn):
+    # KPI History charts read these instead of decoding every snapshot
+    create_timeseries_tables(conn)
+    backfill_timeseries(conn)
+
+
+def _coerce_timeseries_numbers(conn):
+    # percent_spent is REAL; rows written before write_timeseries coerced it may hold text
+    coerce_timeseries_numbers(conn)
+
+
+# (version, description, migration) — append only; never renumber applied versions
+MIGRATIONS = [
+    (1, "base tables", _create_base_tables),
+    (2, "files.raw_text and files.metadata", _add_document_columns),
+    (3, "files (project_id, report_date) / (project_id, uploaded_at) indexes", _add_files_indexes),
+    (4, "normalized snapshot tables + backfill", _create_normalized_tables),
+    (5, "files.content_hash + index", _add_content_hash),
+    (6, "snapshot_deltas table", _create_snapshot_deltas),
+    (7, "files.snapshot_base + delta-encode stored snapshots", _add_snapshot_deltas_encoding),
+    (8, "kpi_timeseries / budget_category_timeseries + backfill", _create_timeseries_tables),
+    (9, "kpi_timeseries / budget_category_timeseries percent_spent as REAL", _coerce_timeseries_numbers),
+]
+
+
+def get_schema_version(conn) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def run_migrations(conn) -> list:
+    """
+    Applies every migration newer than the database's user_version.
+    Migrations are idempotent, so one that fails part-way is simply re-run next start.
+    Returns the descriptions of the migrations that were applied.
+    """
+    applied = []
+    current = get_schema_version(conn)
+    for version, description, migrate in MIGRATIONS:
+        if version <= current:
+            continue
+        try:
+            migrate(conn)
+            conn.execute(f"PRAGMA user_version = {int(version)}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(description)
+    return applied
+
+
+def get_connection(db_path: str = DB_PATH, check_same_thread: bool = False) -> sqlite3.Connection:
+    """Opens the project database, running pending migrations on first use in this process."""
+    os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+    conn = sqlite3.connect(db_path, check_same_thread=check_same_thread)
+
+    if db_path not in _migrated_paths:
+        with _migration_lock:
+            if db_path not in _migrated_paths:
+                run_migrations(conn)
+                migrate_legacy_rows(conn)  # Lazy compression of pre-codec rows, one batch per process
+                _migrated_paths.add(db_path)
+    return conn
@@ -0,0 +1,165 @@
+import os
+import json
+import hashlib
+import tempfile
+import threading
+import functools
+
+# ---------- CONFIG ----------
+# Parser output keyed by (parser, parser version, file-content hash), one JSON file per
+# entry. Streamlit reruns re-submit the same uploads, so repeated parses become a file read.
+EXTRACT_CACHE_DIR = os.getenv("EXTRACT_CACHE_DIR", os.path.join("data", "extract_cache"))
+EXTRACT_CACHE_MAX_BYTES = int(os.getenv("EXTRACT_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+EXTRACT_CACHE_ENABLED = os.getenv("EXTRACT_CACHE_ENABLED", "1") != "0"
+
+_lock = threading.Lock()
+
+# In-process counters (shared by every page in the Streamlit server process)
+_stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+
+
+def _read_source_bytes(source) -> bytes | None:
+    """Reads the bytes behind a parser argument (path, Streamlit upload or file object)."""
+    if hasattr(source, "getvalue"):
+        return source.getvalue()
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            return f.read()
+    if hasattr(source, "read") and hasattr(source, "seek"):
+        position = source.tell()
+        data = source.read()
+        source.seek(position)
+        return data
+    return None
+
+
+def make_extract_key(parser_name: str, parser_version, data: bytes) -> str:
+    content_hash = hashlib.sha256(data).hexdigest()
+    return hashlib.sha256(f"{parser_name}:{parser_version}:{content_hash}".encode("utf-8")).hexdigest()
+
+
+def _entry_path(key: str) -> str:
+    return os.path.join(EXTRACT_CACHE_DIR, f"{key}.json")
+
+
+def get_cached_extraction(key: str) -> dict | None:
+    path = _entry_path(key)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            result = json.load(f)
+    except (OSError, ValueError):
+        with _lock:
+            _stats["misses"] += 1
+        return None
+
+    try:
+        os.utime(path)  # mtime doubles as last-used time for LRU eviction
+    except OSError:
+        pass
+    with _lock:
+        _stats["hits"] += 1
+    return result
+
+
+def put_cached_extraction(key: str, result: dict) -> None:
+    """Writes an entry atomically, then evicts least-recently-used entries over the size budget."""
+    os.makedirs(EXTRACT_CACHE_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=EXTRACT_CACHE_DIR, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, default=str)
+        os.replace(tmp_path, _entry_path(key))
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    with _lock:
+        _stats["writes"] += 1
+        _evict()
+
+
+def _list_entries() -> list:
+    entries = []
+    for name in os.listdir(EXTRACT_CACHE_DIR):
+        if not name.endswith(".json"):
+            continue
+        try:
+            stat = os.stat(os.path.join(EXTRACT_CACHE_DIR, name))
+        except OSError:
+            continue  # Removed concurrently
+        entries.append((stat.st_mtime, stat.st_size, name))
+    return entries
+
+
+def _evict() -> None:
+    entries = _list_entries()
+    total = sum(size for _, size, _ in entries)
+    for _, size, name in sorted(entries):
+        if total <= EXTRACT_CACHE_MAX_BYTES:
+            break
+        try:
+            os.remove(os.path.join(EXTRACT_CACHE_DIR, name))
+            _stats["evictions"] += 1
+        except OSError:
+            pass
+        total -= size
+
+
+def cached_extraction(parser_version):
+    """
+    Decorator for parse_*_status(file_path) functions: returns the stored result when the
+    same bytes were already parsed by the same parser version. Bump the parser's version
+    whenever its output changes. Results carrying a parse error are never stored.
+    """
+    def decorator(parse):
+        parser_name = f"{parse.__module__}.{parse.__qualname__}"
+
+        @functools.wraps(parse)
+        def wrapper(file_path, *args, **kwargs):
+            if not EXTRACT_CACHE_ENABLED or args or kwargs:
+                return parse(file_path, *args, **kwargs)
+
+            data = _read_source_bytes(file_path)
+            if data is None:
+                return parse(file_path)
+
+            key = make_extract_key(parser_name, parser_version, data)
+            cached = get_cached_extraction(key)
+            if cached is not None:
+                return cached
+
+            result = parse(file_path)
+            parsed = result.get("parsed") if isinstance(result, dict) else None
+            if isinstance(result, dict) and not (isinstance(parsed, dict) and "error" in parsed):
+                try:
+                    put_cached_extraction(key, result)
+                except OSError:
+                    pass  # A read-only or full disk only costs the cache
+            return result
+
+        return wrapper
+    return decorator
+
+
+def clear_extract_cache() -> None:
+    with _lock:
+        if not os.path.isdir(EXTRACT_CACHE_DIR):
+            return
+        for _, _, name in _list_entries():
+            try:
+                os.remove(os.path.join(EXTRACT_CACHE_DIR, name))
+            except OSError:
+                pass
+
+
+def get_extract_cache_stats() -> dict:
+    """Returns hit/miss counters for this process plus the current entry count and size."""
+    with _lock:
+        entries = _list_entries() if os.path.isdir(EXTRACT_CACHE_DIR) else []
+        stats = dict(_stats)
+    stats["entries"] = len(entries)
+    stats["bytes"] = sum(size for _, size, _ in entries)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+    return stats
@@ -0,0 +1,71 @@
+# === Minimal JSON Schema helpers for structured LLM output ===
+# Only the subset needed for strict structured outputs: object, array, string,
+# number, integer, boolean and null (including type unions).
+
+_PY_TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "boolean": bool,
+    "null": type(None),
+}
+
+
+def schema_from_example(example) -> dict:
+    """
+    Derives a strict JSON schema from an example instance.
+    - dicts become closed objects with every key required
+    - lists take their item schema from the first element
+    - placeholder scalars ("", 0, None) are nullable, since documents often omit them
+    """
+    if isinstance(example, dict):
+        return {
+            "type": "object",
+            "properties": {k: schema_from_example(v) for k, v in example.items()},
+            "required": list(example.keys()),
+            "additionalProperties": False,
+        }
+    if isinstance(example, list):
+        item = example[0] if example else ""
+        return {"type": "array", "items": schema_from_example(item)}
+    if isinstance(example, bool):
+        return {"type": ["boolean", "null"]}
+    if isinstance(example, (int, float)):
+        return {"type": ["number", "null"]}
+    if isinstance(example, str):
+        return {"type": ["string", "null"]}
+    return {"type": ["string", "number", "null"]}
+
+
+def _matches_type(value, type_name: str) -> bool:
+    if type_name == "number":
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+    if type_name == "integer":
+        return isinstance(value, int) and not isinstance(value, bool)
+    return isinstance(value, _PY_TYPES[type_name])
+
+
+def validate_json(instance, schema: dict, path: str = "$") -> None:
+    """Raises ValueError describing the first place `instance` does not match `schema`."""
+    types = schema.get("type")
+    if types is not None:
+        type_list = types if isinstance(types, list) else [types]
+        if not any(_matches_type(instance, t) for t in type_list):
+            raise ValueError(f"{path}: expected {' or '.join(type_list)}, got {type(instance).__name__}")
+
+    if isinstance(instance, dict):
+        properties = schema.get("properties", {})
+        for key in schema.get("required", []):
+            if key not in instance:
+                raise ValueError(f"{path}: missing required field '{key}'")
+        if schema.get("additionalProperties") is False:
+            extra = set(instance) - set(properties)
+            if extra:
+                raise ValueError(f"{path}: unexpected field(s) {sorted(extra)}")
+        for key, value in instance.items():
+            if key in properties:
+                validate_json(value, properties[key], f"{path}.{key}")
+
+    elif isinstance(instance, list) and "items" in schema:
+        for i, item in enumerate(instance):
+            validate_json(item, schema["items"], f"{path}[{i}]")
@@ -0,0 +1,169 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+
+# ---------- CONFIG ----------
+# Lives next to data/project_data.db so warm reruns never touch Azure.
+CACHE_DB_PATH = os.getenv("LLM_CACHE_PATH", os.path.join("data", "llm_cache.db"))
+CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") != "0"
+
+_lock = threading.Lock()
+_initialized = False
+
+# In-process counters (shared by every page in the Streamlit server process)
+_stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+
+
+def _connect():
+    global _initialized
+    os.makedirs(os.path.dirname(CACHE_DB_PATH) or ".", exist_ok=True)
+    conn = sqlite3.connect(CACHE_DB_PATH, timeout=30)
+    if not _initialized:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                cache_key TEXT PRIMARY KEY,
+                deployment TEXT,
+                api_version TEXT,
+                response TEXT,
+                created_at REAL,
+                last_used_at REAL,
+                hit_count INTEGER DEFAULT 0
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_used ON llm_cache(last_used_at)")
+        conn.commit()
+        _initialized = True
+    return conn
+
+
+def normalize_prompt(text: str) -> str:
+    """
+    Normalizes a prompt so that cosmetic whitespace differences (indentation of
+    f-string templates, trailing spaces, blank line runs) map to the same key.
+    """
+    lines = [line.strip() for line in text.strip().splitlines()]
+    normalized = []
+    for line in lines:
+        if not line and normalized and not normalized[-1]:
+            continue
+        normalized.append(line)
+    return "\n".join(normalized)
+
+
+def make_cache_key(deployment: str, api_version: str, messages: list, extra: dict | None = None) -> str:
+    """
+    Builds the cache key from (deployment, api_version, normalized prompt hash).
+    `extra` carries request options that change the output (e.g. a response schema).
+    """
+    payload = {
+        "deployment": deployment,
+        "api_version": api_version,
+        "messages": [
+            {"role": m["role"], "content": normalize_prompt(m["content"])}
+            for m in messages
+        ],
+        "extra": extra or {},
+    }
+    encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def get_cached(cache_key: str) -> str | None:
+    """Returns the cached response, or None on a miss or an expired entry."""
+    if not CACHE_ENABLED:
+        return None
+
+    now = time.time()
+    with _lock:
+        conn = _connect()
+        try:
+            row = conn.execute(
+                "SELECT response, created_at FROM llm_cache WHERE cache_key = ?",
+                (cache_key,)
+            ).fetchone()
+
+            if row is None or (CACHE_TTL_SECONDS > 0 and now - row[1] > CACHE_TTL_SECONDS):
+                _stats["misses"] += 1
+                return None
+
+            conn.execute(
+                "UPDATE llm_cache SET last_used_at = ?, hit_count = hit_count + 1 WHERE cache_key = ?",
+                (now, cache_key)
+            )
+            conn.commit()
+            _stats["hits"] += 1
+            return row[0]
+        finally:
+            conn.close()
+
+
+def put_cached(cache_key: str, deployment: str, api_version: str, response: str) -> None:
+    """Stores a response and evicts expired / least-recently-used entries."""
+    if not CACHE_ENABLED:
+        return
+
+    now = time.time()
+    with _lock:
+        conn = _connect()
+        try:
+            conn.execute("""
+                INSERT OR REPLACE INTO llm_cache
+                (cache_key, deployment, api_version, response, created_at, last_used_at, hit_count)
+                VALUES (?, ?, ?, ?, ?, ?, 0)
+            """, (cache_key, deployment, api_version, response, now, now))
+            _stats["writes"] += 1
+
+            # --- TTL eviction ---
+            if CACHE_TTL_SECONDS > 0:
+                cur = conn.execute(
+                    "DELETE FROM llm_cache WHERE created_at < ?",
+                    (now - CACHE_TTL_SECONDS,)
+                )
+                _stats["evictions"] += max(cur.rowcount, 0)
+
+            # --- Size / LRU eviction ---
+            count = conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+            overflow = count - CACHE_MAX_ENTRIES
+            if overflow > 0:
+                conn.execute("""
+                    DELETE FROM llm_cache WHERE cache_key IN (
+                        SELECT cache_key FROM llm_cache
+                        ORDER BY last_used_at ASC
+                        LIMIT ?
+                    )
+                """, (overflow,))
+                _stats["evictions"] += overflow
+
+            conn.commit()
+        finally:
+            conn.close()
+
+
+def clear_cache() -> None:
+    with _lock:
+        conn = _connect()
+        try:
+            conn.execute("DELETE FROM llm_cache")
+            conn.commit()
+        finally:
+            conn.close()
+
+
+def get_cache_stats() -> dict:
+    """Returns hit/miss counters for this process plus the current entry count."""
+    with _lock:
+        conn = _connect()
+        try:
+            entries = conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        finally:
+            conn.close()
+    stats = dict(_stats)
+    stats["entries"] = entries
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+    return stats
@@ -0,0 +1,81 @@
+# === Typed LLM errors ===
+# Every ask_gpt* / stream_gpt failure surfaces as one of these instead of an
+# "[Azure GPT ERROR] ..." string, so callers can tell a failure from an answer.
+
+
+class LLMError(Exception):
+    """Base class for failed LLM calls."""
+
+    def __init__(self, message: str, call_site: str = "default", status_code: int | None = None):
+        super().__init__(message)
+        self.call_site = call_site
+        self.status_code = status_code
+
+
+class LLMRateLimitError(LLMError):
+    """429 from the deployment, still failing after every retry."""
+
+
+class LLMTimeoutError(LLMError):
+    """The request timed out (after retries)."""
+
+
+class LLMConnectionError(LLMError):
+    """The endpoint could not be reached (after retries)."""
+
+
+class LLMServerError(LLMError):
+    """5xx from the service (after retries)."""
+
+
+class LLMRequestError(LLMError):
+    """Non-retryable rejection: bad request, authentication, content filter, etc."""
+
+
+class LLMResponseError(LLMError, ValueError):
+    """The call succeeded but the reply is empty or does not match the requested schema."""
+
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+def status_code_of(exc) -> int | None:
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        response = getattr(exc, "response", None)
+        status = getattr(response, "status_code", None)
+    return status
+
+
+def is_retryable(exc) -> bool:
+    if isinstance(exc, LLMError):
+        return isinstance(exc, (LLMRateLimitError, LLMTimeoutError, LLMConnectionError, LLMServerError))
+    name = type(exc).__name__
+    if "Timeout" in name or "Connection" in name:
+        return True
+    return status_code_of(exc) in RETRYABLE_STATUS
+
+
+def to_llm_error(exc, call_site: str = "default") -> LLMError:
+    """Maps an openai / httpx exception onto the LLMError hierarchy."""
+    if isinstance(exc, LLMError):
+        return exc
+
+    status = status_code_of(exc)
+    name = type(exc).__name__
+    message = f"{name}: {exc}"
+    if status == 429:
+        cls = LLMRateLimitError
+    elif "Timeout" in name:
+        cls = LLMTimeoutError
+    elif "Connection" in name:
+        cls = LLMConnectionError
+    elif status is not None and status >= 500:
+        cls = LLMServerError
+    elif status is not None:
+        cls = LLMRequestError
+    else:
+        cls = LLMError
+    error = cls(message, call_site=call_site, status_code=status)
+    error.__cause__ = exc
+    return error
@@ -0,0 +1,203 @@
+# === Client-side LLM request scheduler ===
+# Every Azure call goes through call_with_retry() / call_with_retry_async():
+#   - token buckets keep requests-per-minute and tokens-per-minute under the
+#     deployment's quota (AZURE_RPM_LIMIT / AZURE_TPM_LIMIT, 0 = unlimited)
+#   - a 429's Retry-After pauses every caller in the process, not just the one that got it
+#   - retryable failures (429, 408, 5xx, timeouts, connection errors) are retried with
+#     jittered exponential backoff; anything left is raised as a typed LLMError
+# Buckets are shared by sync and async callers across all threads.
+
+import os
+import time
+import random
+import asyncio
+import threading
+from email.utils import parsedate_to_datetime
+from utils.llm_errors import is_retryable, to_llm_error
+
+RPM_LIMIT = int(os.getenv("AZURE_RPM_LIMIT", "0"))
+TPM_LIMIT = int(os.getenv("AZURE_TPM_LIMIT", "0"))
+COMPLETION_TOKEN_ESTIMATE = int(os.getenv("AZURE_COMPLETION_TOKEN_ESTIMATE", "1000"))  # Reserved until usage is known
+RETRY_ATTEMPTS = int(os.getenv("AZURE_RETRY_ATTEMPTS", "5"))
+BACKOFF_BASE_SECONDS = float(os.getenv("AZURE_BACKOFF_BASE_SECONDS", "1"))
+BACKOFF_MAX_SECONDS = float(os.getenv("AZURE_BACKOFF_MAX_SECONDS", "60"))
+
+
+class TokenBucket:
+    """
+    Continuous-refill bucket of `per_minute` units. reserve() takes the units right away
+    (the balance may go negative) and returns how long the caller must wait first, so
+    waiting happens outside the lock and callers are served in arrival order.
+    """
+
+    def __init__(self, per_minute: int):
+        self.per_minute = per_minute
+        self.capacity = float(per_minute)
+        self.available = float(per_minute)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.per_minute / 60.0)
+        self.updated = now
+
+    def reserve(self, amount: float) -> float:
+        if self.per_minute <= 0:
+            return 0.0
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.available -= min(amount, self.capacity)  # Oversized requests wait for a full bucket at most
+            if self.available >= 0:
+                return 0.0
+            return -self.available * 60.0 / self.per_minute
+
+    def adjust(self, delta: float) -> None:
+        """Returns (delta > 0) or charges (delta < 0) units once the real cost is known."""
+        if self.per_minute <= 0 or not delta:
+            return
+        with self.lock:
+            self._refill(time.monotonic())
+            self.available = min(self.capacity, self.available + delta)
+
+
+_request_bucket = TokenBucket(RPM_LIMIT)
+_token_bucket = TokenBucket(TPM_LIMIT)
+
+_cooldown_lock = threading.Lock()
+_cooldown_until = 0.0  # monotonic time before which no request is sent (Retry-After)
+
+_stats_lock = threading.Lock()
+_stats = {"requests": 0, "retries": 0, "rate_limited": 0, "throttle_wait_seconds": 0.0, "failures": 0}
+
+
+def _count(key, amount=1):
+    with _stats_lock:
+        _stats[key] += amount
+
+
+def get_scheduler_stats() -> dict:
+    with _stats_lock:
+        return dict(_stats)
+
+
+def _retry_after_seconds(exc) -> float | None:
+    """Reads retry-after-ms / retry-after (seconds or HTTP date) from the error's response."""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000.0
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except Exception:
+            return None
+
+
+def _backoff_delay(attempt: int, exc) -> float:
+    retry_after = _retry_after_seconds(exc)
+    if retry_after is not None:
+        return retry_after + random.uniform(0, BACKOFF_BASE_SECONDS)
+    # Full jitter: uniform in [0, min(max, base * 2^attempt)]
+    return random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * (2 ** attempt)))
+
+
+def _start_cooldown(seconds: float) -> None:
+    global _cooldown_until
+    with _cooldown_lock:
+        _cooldown_until = max(_cooldown_until, time.monotonic() + seconds)
+
+
+def _admission_delay(estimated_tokens: int) -> float:
+    """Reserves one request and the estimated tokens; returns the wait before sending."""
+    with _cooldown_lock:
+        cooldown = max(0.0, _cooldown_until - time.monotonic())
+    wait = max(
+        cooldown,
+        _request_bucket.reserve(1),
+        _token_bucket.reserve(estimated_tokens + COMPLETION_TOKEN_ESTIMATE),
+    )
+    if wait:
+        _count("throttle_wait_seconds", wait)
+    return wait
+
+
+def settle_usage(estimated_tokens: int, usage) -> None:
+    """
+    Corrects the token bucket with the usage the API reported. Streamed calls pass the
+    usage of their final chunk once the stream ends; without usage the estimate stays.
+    """
+    if usage is None:
+        return
+    actual = (getattr(usage, "prompt_tokens", 0) or 0) + (getattr(usage, "completion_tokens", 0) or 0)
+    _token_bucket.adjust(estimated_tokens + COMPLETION_TOKEN_ESTIMATE - actual)
+
+
+def _settle(estimated_tokens: int, response) -> None:
+    settle_usage(estimated_tokens, getattr(response, "usage", None))
+
+
+def _refund(estimated_tokens: int) -> None:
+    """Returns a failed attempt's token reservation (the retry reserves again)."""
+    _token_bucket.adjust(estimated_tokens + COMPLETION_TOKEN_ESTIMATE)
+
+
+def _on_failure(exc, attempt: int, call_site: str):
+    """Returns the delay before the next attempt, or raises the typed error when done."""
+    error = to_llm_error(exc, call_site)
+    if error.status_code == 429:
+        _count("rate_limited")
+    if not is_retryable(error) or attempt + 1 >= RETRY_ATTEMPTS:
+        _count("failures")
+        raise error from exc
+
+    delay = _backoff_delay(attempt, exc)
+    if error.status_code == 429:
+        _start_cooldown(delay)
+    _count("retries")
+    return delay
+
+
+def call_with_retry(request, call_site: str = "default", estimated_tokens: int = 0):
+    """Runs `request()` (a synchronous Azure call) under the rate limits, retrying transient failures."""
+    for attempt in range(max(1, RETRY_ATTEMPTS)):
+        wait = _admission_delay(estimated_tokens)
+        if wait:
+            time.sleep(wait)
+        _count("requests")
+        try:
+            response = request()
+        except Exception as exc:
+            _refund(estimated_tokens)
+            time.sleep(_on_failure(exc, attempt, call_site))
+            continue
+        _settle(estimated_tokens, response)
+        return response
+
+
+async def call_with_retry_async(request, call_site: str = "default", estimated_tokens: int = 0):
+    """Async variant: `request()` returns an awaitable; waits never block the event loop."""
+    for attempt in range(max(1, RETRY_ATTEMPTS)):
+        wait = _admission_delay(estimated_tokens)
+        if wait:
+            await asyncio.sleep(wait)
+        _count("requests")
+        try:
+            response = await request()
+        except Exception as exc:
+            _refund(estimated_tokens)
+            await asyncio.sleep(_on_failure(exc, attempt, call_site))
+            continue
+        _settle(estimated_tokens, response)
+        return response
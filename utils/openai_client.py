@@ -1,33 +1,264 @@
 import os
-from dotenv import load_dotenv
-from openai import AzureOpenAI
-
-# Load environment variables
-load_dotenv()
-
-# Azure-specific config
-endpoint = os.getenv("ENDPOINT_URL", "https://ppiproj-resource.services.ai.azure.com/api/projects/ppiproj")
-deployment = os.getenv("DEPLOYMENT_NAME", "o4-mini")
-subscription_key = os.getenv("AZURE_OPENAI_API_KEY", "REPLACE_WITH_YOUR_KEY_VALUE_HERE")
-api_version = os.getenv("AZURE_API_VERSION", "2025-01-01-preview")
-
-# Initialize Azure OpenAI client
-client = AzureOpenAI(
-    azure_endpoint=endpoint,
-    api_key=subscription_key,
-    api_version=api_version,
-)
-
-def ask_gpt(prompt: str) -> str:
-    try:
-        response = client.chat.completions.create(
+import json
+import asyncio
+from utils.azure_client import deployment, api_version, get_client, get_async_client, run_async, submit_async
+from utils.llm_cache import make_cache_key, get_cached, put_cached
+from utils.json_schema import validate_json
+from utils.prompting import count_message_tokens, record_usage, record_response_usage
+from utils.llm_errors import LLMResponseError, to_llm_error
+from utils.llm_scheduler import call_with_retry, call_with_retry_async, settle_usage
+
+# Max in-flight requests for ask_gpt_async fan-out
+MAX_CONCURRENCY = int(os.getenv("AZURE_MAX_CONCURRENCY", "4"))
+
+# Clients are created lazily and shared process-wide (see utils/azure_client.py)
+
+SYSTEM_PROMPT = "You are a helpful assistant."
+
+
+def _build_messages(prompt: str) -> list:
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+
+
+def _message_text(response, call_site: str) -> str:
+    content = (response.choices[0].message.content or "").strip() if response.choices else ""
+    if not content:
+        raise LLMResponseError("Empty response from Azure OpenAI", call_site=call_site)
+    return content
+
+
+def ask_gpt(prompt: str, use_cache: bool = True, call_site: str = "default") -> str:
+    """
+    Sends a single-turn prompt to Azure OpenAI.
+    Identical prompts are answered from the local SQLite cache (see utils/llm_cache.py);
+    pass use_cache=False at call sites whose answer must be fresh.
+    Token usage is recorded under `call_site` (see utils/prompting.py).
+    Requests are rate limited and retried by utils/llm_scheduler.py; a call that still
+    fails raises an LLMError subclass (see utils/llm_errors.py).
+    """
+    messages = _build_messages(prompt)
+    cache_key = make_cache_key(deployment, api_version, messages)
+    estimated_tokens = count_message_tokens(messages)
+
+    if use_cache:
+        cached = get_cached(cache_key)
+        if cached is not None:
+            record_usage(call_site, estimated_tokens, cached=True)
+            return cached
+
+    response = call_with_retry(
+        lambda: get_client().chat.completions.create(
+            model=deployment,
+            messages=messages,
+            max_completion_tokens=100000 # adjust if needed
+        ),
+        call_site=call_site,
+        estimated_tokens=estimated_tokens
+    )
+    record_response_usage(call_site, estimated_tokens, response)
+    content = _message_text(response, call_site)
+
+    # Errors are never cached; a fresh answer always refreshes the entry
+    put_cached(cache_key, deployment, api_version, content)
+    return content
+
+
+async def ask_gpt_async(prompt: str, use_cache: bool = True, call_site: str = "default") -> str:
+    """
+    Async variant of ask_gpt() built on AsyncAzureOpenAI.
+    Same cache, scheduling and error conventions, so callers can switch without other changes.
+    """
+    messages = _build_messages(prompt)
+    cache_key = make_cache_key(deployment, api_version, messages)
+    estimated_tokens = count_message_tokens(messages)
+
+    if use_cache:
+        cached = get_cached(cache_key)
+        if cached is not None:
+            record_usage(call_site, estimated_tokens, cached=True)
+            return cached
+
+    response = await call_with_retry_async(
+        lambda: get_async_client().chat.completions.create(
             model=deployment,
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant."},
-                {"role": "user", "content": prompt}
-            ],
+            messages=messages,
             max_completion_tokens=100000 # adjust if needed
-        )
-        return response.choices[0].message.content.strip()
+        ),
+        call_site=call_site,
+        estimated_tokens=estimated_tokens
+    )
+    record_response_usage(call_site, estimated_tokens, response)
+    content = _message_text(response, call_site)
+
+    put_cached(cache_key, deployment, api_version, content)
+    return content
+
+
+def stream_gpt(prompt: str, use_cache: bool = True, call_site: str = "default"):
+    """
+    Streaming variant of ask_gpt(): yields text deltas as they arrive so the UI can
+    render progressively (e.g. st.write_stream). A cache hit yields the full text once.
+    The complete response is cached when the stream finishes.
+    """
+    messages = _build_messages(prompt)
+    cache_key = make_cache_key(deployment, api_version, messages)
+    estimated_tokens = count_message_tokens(messages)
+
+    if use_cache:
+        cached = get_cached(cache_key)
+        if cached is not None:
+            record_usage(call_site, estimated_tokens, cached=True)
+            yield cached
+            return
+
+    # Opening the stream is scheduled and retried; a failure mid-stream raises LLMError
+    stream = call_with_retry(
+        lambda: get_client().chat.completions.create(
+            model=deployment,
+            messages=messages,
+            max_completion_tokens=100000, # adjust if needed
+            stream=True,
+            stream_options={"include_usage": True}
+        ),
+        call_site=call_site,
+        estimated_tokens=estimated_tokens
+    )
+
+    parts = []
+    usage = None
+    try:
+        for chunk in stream:
+            if getattr(chunk, "usage", None):
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                parts.append(delta)
+                yield delta
     except Exception as e:
-        return f"[Azure GPT ERROR] {e}" #test
+        raise to_llm_error(e, call_site) from e
+
+    # The stream object carries no usage, so the scheduler is settled from the final chunk
+    settle_usage(estimated_tokens, usage)
+    record_usage(
+        call_site,
+        estimated_tokens,
+        prompt_tokens=getattr(usage, "prompt_tokens", 0) if usage else 0,
+        completion_tokens=getattr(usage, "completion_tokens", 0) if usage else 0,
+    )
+    content = "".join(parts).strip()
+    if content:
+        put_cached(cache_key, deployment, api_version, content)
+
+
+def _json_response_format(schema: dict, schema_name: str) -> dict:
+    return {
+        "type": "json_schema",
+        "json_schema": {"name": schema_name, "schema": schema, "strict": True},
+    }
+
+
+def _parse_structured(content: str, schema: dict, call_site: str = "default") -> dict:
+    try:
+        data = json.loads(content)
+    except Exception as e:
+        raise LLMResponseError(f"Structured output was not valid JSON: {e}", call_site=call_site)
+    try:
+        validate_json(data, schema)
+    except ValueError as e:
+        raise LLMResponseError(str(e), call_site=call_site)
+    return data
+
+
+def ask_gpt_json(prompt: str, schema: dict, schema_name: str = "response", use_cache: bool = True,
+                 call_site: str = "default") -> dict:
+    """
+    Structured-output variant of ask_gpt(): the model is constrained to `schema`
+    (strict json_schema response format) and the reply is parsed and validated.
+    Raises LLMError if the call fails (LLMResponseError, also a ValueError, if the
+    reply does not match the schema).
+    """
+    messages = _build_messages(prompt)
+    cache_key = make_cache_key(deployment, api_version, messages, extra={"schema": schema})
+    estimated_tokens = count_message_tokens(messages)
+
+    if use_cache:
+        cached = get_cached(cache_key)
+        if cached is not None:
+            record_usage(call_site, estimated_tokens, cached=True)
+            return _parse_structured(cached, schema, call_site)
+
+    response = call_with_retry(
+        lambda: get_client().chat.completions.create(
+            model=deployment,
+            messages=messages,
+            response_format=_json_response_format(schema, schema_name),
+            max_completion_tokens=100000 # adjust if needed
+        ),
+        call_site=call_site,
+        estimated_tokens=estimated_tokens
+    )
+    record_response_usage(call_site, estimated_tokens, response)
+    content = _message_text(response, call_site)
+
+    data = _parse_structured(content, schema, call_site)
+    put_cached(cache_key, deployment, api_version, content)
+    return data
+
+
+async def ask_gpt_json_async(prompt: str, schema: dict, schema_name: str = "response", use_cache: bool = True,
+                             call_site: str = "default") -> dict:
+    """Async variant of ask_gpt_json()."""
+    messages = _build_messages(prompt)
+    cache_key = make_cache_key(deployment, api_version, messages, extra={"schema": schema})
+    estimated_tokens = count_message_tokens(messages)
+
+    if use_cache:
+        cached = get_cached(cache_key)
+        if cached is not None:
+            record_usage(call_site, estimated_tokens, cached=True)
+            return _parse_structured(cached, schema, call_site)
+
+    response = await call_with_retry_async(
+        lambda: get_async_client().chat.completions.create(
+            model=deployment,
+            messages=messages,
+            response_format=_json_response_format(schema, schema_name),
+            max_completion_tokens=100000 # adjust if needed
+        ),
+        call_site=call_site,
+        estimated_tokens=estimated_tokens
+    )
+    record_response_usage(call_site, estimated_tokens, response)
+    content = _message_text(response, call_site)
+
+    data = _parse_structured(content, schema, call_site)
+    put_cached(cache_key, deployment, api_version, content)
+    return data
+
+
+async def gather_bounded(coros, limit: int = MAX_CONCURRENCY, return_exceptions: bool = False) -> list:
+    """
+    Awaits the given coroutines with at most `limit` running at once.
+    Results are returned in input order; with return_exceptions=True a failed
+    coroutine's exception takes its place instead of being raised.
+    """
+    semaphore = asyncio.Semaphore(max(1, limit))
+
+    async def run(coro):
+        async with semaphore:
+            return await coro
+
+    return await asyncio.gather(*(run(c) for c in coros), return_exceptions=return_exceptions)
+
+
+def run_concurrently(coros, limit: int = MAX_CONCURRENCY, return_exceptions: bool = False) -> list:
+    """
+    Synchronous entry point for Streamlit scripts: runs independent LLM coroutines
+    concurrently and returns their results in order.
+    """
+    return run_async(gather_bounded(coros, limit, return_exceptions))
@@ -1,7 +1,12 @@
 from docx import Document
-from utils.openai_client import ask_gpt
+from utils.openai_client import ask_gpt, ask_gpt_async, run_concurrently
+from utils.llm_errors import LLMError
+from utils.extract_cache import cached_extraction
+from utils.prompting import split_into_chunks
 import json
 
+PARSER_VERSION = 2  # Bump when the output of parse_docx_status changes
+
 
 def extract_text_from_docx(file_path: str) -> str:
     doc = Document(file_path)
@@ -12,12 +17,16 @@ def extract_text_from_docx(file_path: str) -> str:
             full_text.append(flat)
     return "\n".join(full_text)
 
-def extract_sections_via_llm(text: str) -> dict:
-    prompt = f"""
+LEGACY_CHUNK_CHARS = 6000
+LEGACY_TEXT_FIELDS = ("summary", "issues", "next_steps")  # Narrative fields: parts are concatenated
+
+
+def build_legacy_prompt(text: str) -> str:
+    return f"""
 You are an AI assistant that extracts structured project status data from text.
 
 Text:
-{text[:6000]}  # Truncated for token limits.
+{text}
 
 Please extract and return a JSON object with the following fields:
 - project_name: str
@@ -29,16 +38,59 @@ Please extract and return a JSON object with the following fields:
 
 Respond with only the JSON.
     """
-    response = ask_gpt(prompt)
+
+
+def merge_legacy_sections(parts: list) -> dict:
+    """
+    Merges per-chunk extractions in document order: narrative fields are concatenated,
+    KPI keys and other fields keep the first non-empty value.
+    """
+    merged = {}
+    for part in parts:
+        for field, value in part.items():
+            if value in (None, "", [], {}):
+                continue
+            if field in LEGACY_TEXT_FIELDS and field in merged and isinstance(value, str):
+                if value not in merged[field]:
+                    merged[field] = f"{merged[field]}\n{value}"
+            elif isinstance(value, dict) and isinstance(merged.get(field), dict):
+                for key, item in value.items():
+                    if merged[field].get(key) in (None, "") and item not in (None, ""):
+                        merged[field][key] = item
+            else:
+                merged.setdefault(field, dict(value) if isinstance(value, dict) else value)
+    return merged
+
+
+def extract_sections_via_llm(text: str) -> dict:
+    chunks = split_into_chunks(text, LEGACY_CHUNK_CHARS) or [""]
     try:
-        parsed = json.loads(response)
-        return parsed
-    except Exception as e:
+        if len(chunks) == 1:
+            responses = [ask_gpt(build_legacy_prompt(chunks[0]), call_site="docx_legacy_extract")]
+        else:
+            # Long documents: extract every chunk concurrently instead of truncating
+            responses = run_concurrently([
+                ask_gpt_async(build_legacy_prompt(chunk), call_site="docx_legacy_extract") for chunk in chunks
+            ])
+    except LLMError as e:
+        # The raw text is still usable by the main ingestion pipeline
         return {
             "error": str(e),
-            "raw_response": response
+            "raw_response": None
         }
 
+    parts = []
+    for response in responses:
+        try:
+            parts.append(json.loads(response))
+        except Exception as e:
+            return {
+                "error": str(e),
+                "raw_response": response
+            }
+    return parts[0] if len(parts) == 1 else merge_legacy_sections(parts)
+
+@cached_extraction(PARSER_VERSION)
 def parse_docx_status(file_path: str) -> dict:
     raw_text = extract_text_from_docx(file_path)
     parsed = extract_sections_via_llm(raw_text)
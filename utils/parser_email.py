@@ -1,6 +1,11 @@
 import email
 from email import policy
+from utils.extract_cache import cached_extraction
 
+PARSER_VERSION = 1  # Bump when the output of parse_email_status changes
+
+
+@cached_extraction(PARSER_VERSION)
 def parse_email_status(file_path):
     with open(file_path, 'rb') as f:
         msg = email.message_from_binary_file(f, policy=policy.default)
@@ -0,0 +1,205 @@
+# utils/parser_excel.py
+# === Excel project snapshot reader ===
+# Reads an uploaded tracker workbook in one pass: the file is opened once in openpyxl's
+# streaming read-only mode, and each sheet in EXCEL_SHEETS is read once, limited to the
+# columns it declares. Type and date coercion then runs per column on the whole section.
+
+import os
+from io import BytesIO
+import pandas as pd
+from openpyxl import load_workbook
+
+# Stop reading a sheet after this many consecutive empty rows (formatted-but-empty tails)
+EXCEL_BLANK_ROW_LIMIT = int(os.getenv("EXCEL_BLANK_ROW_LIMIT", "50"))
+
+# "Contents" sheet: single cells (row, column; 1-based) and the contacts block
+CONTENTS_SHEET = "Contents"
+CONTENTS_CELLS = {
+    "date": (7, 6),        # F7
+    "issuer": (2, 2),      # B2
+    "name": (3, 2),        # B3
+    "start_date": (5, 2),  # B5
+    "summary": (6, 2),     # B6
+    "tags": (10, 2),       # B10
+}
+CONTACTS_FIRST_ROW = 21  # Rows 21+, columns A–D
+CONTACT_COLUMNS = ["Role", "Name", "Organization", "Email"]
+
+# snapshot section -> sheet layout; "header_row" is 1-based, "positive" columns drop
+# rows whose value is not > 0
+EXCEL_SHEETS = {
+    "budget_details": {
+        "sheet": "Budget",
+        "header_row": 2,
+        "columns": ["Category", "Allotted Budget", "Spent Budget", "Remaining Budget", "Percent Spent", "Notes"],
+        "numeric": ["Allotted Budget", "Spent Budget", "Remaining Budget", "Percent Spent"],
+        "dates": [],
+    },
+    "schedule": {
+        "sheet": "Schedule",
+        "header_row": 1,
+        "columns": [
+            "Task ID", "Task Name", "Description", "Assigned To",
+            "Start Date", "End Date", "Duration (Days)", "Status", "Dependencies"
+        ],
+        "numeric": [],
+        "dates": ["Start Date", "End Date"],
+    },
+    "issues": {
+        "sheet": "Issue Log",
+        "header_row": 1,
+        "columns": [
+            "Issue #", "Issue Creation Date", "Issue Category", "Issue Detail",
+            "Recommended Action", "Owner", "Status", "Due Date", "Resolution"
+        ],
+        "numeric": [],
+        "dates": ["Issue Creation Date", "Due Date"],
+    },
+    "deliverables": {
+        "sheet": "Deliverable Status",
+        "header_row": 1,
+        "columns": ["Deliverable", "Status", "Start Date", "Date Due"],
+        "numeric": [],
+        "dates": ["Start Date", "Date Due"],
+    },
+    "risks": {
+        "sheet": "Risk Assessment",
+        "header_row": 1,
+        "columns": [
+            "ID", "Division", "Task Area", "Risk Name", "Risk Description",
+            "Risk Category", "Probability Rating", "Impact Rating", "Risk Rating",
+            "Impact If Not Mitigated", "Action/Mitigation Strategy", "Mitigation Owner(s)",
+            "Action Taken?", "Date Identified"
+        ],
+        "numeric": ["Risk Rating"],
+        "dates": ["Date Identified"],
+        "positive": ["Risk Rating"],
+    },
+}
+
+# kpis field -> Budget column of the "Total" row
+BUDGET_TOTAL_FIELDS = {
+    "allotted_budget": "Allotted Budget",
+    "spent_budget": "Spent Budget",
+    "remaining_budget": "Remaining Budget",
+    "percent_spent": "Percent Spent",
+}
+
+
+def _is_blank(value) -> bool:
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def _read_rows(ws, min_row, max_col, max_row=None):
+    """Value tuples from `min_row` down, stopping after EXCEL_BLANK_ROW_LIMIT empty rows."""
+    blank_run = 0
+    for row in ws.iter_rows(min_row=min_row, max_row=max_row, max_col=max_col, values_only=True):
+        if all(_is_blank(v) for v in row):
+            blank_run += 1
+            if blank_run >= EXCEL_BLANK_ROW_LIMIT:
+                break
+            continue
+        blank_run = 0
+        yield row
+
+
+def _read_contents(ws) -> tuple:
+    last_cell_row = max(r for r, _ in CONTENTS_CELLS.values())
+    cells = {}
+    for i, row in enumerate(ws.iter_rows(min_row=1, max_row=last_cell_row, max_col=6, values_only=True), start=1):
+        for field, (r, c) in CONTENTS_CELLS.items():
+            if r == i and c <= len(row):
+                cells[field] = row[c - 1]
+
+    contacts = [
+        dict(zip(CONTACT_COLUMNS, row + (None,) * (len(CONTACT_COLUMNS) - len(row))))
+        for row in _read_rows(ws, CONTACTS_FIRST_ROW, len(CONTACT_COLUMNS))
+    ]
+    contacts = [c for c in contacts if not _is_blank(c["Name"])]  # Require Name
+    return {field: cells.get(field) for field in CONTENTS_CELLS}, contacts
+
+
+def _read_section(ws, spec) -> tuple:
+    """(records, missing columns) for one sheet spec."""
+    header = next(ws.iter_rows(min_row=spec["header_row"], max_row=spec["header_row"], values_only=True), ())
+    positions = {}
+    for i, title in enumerate(header):
+        if isinstance(title, str) and title.strip() in spec["columns"]:
+            positions.setdefault(title.strip(), i)
+    missing = [col for col in spec["columns"] if col not in positions]
+    if missing:
+        return [], missing
+
+    # Only the cells up to the right-most needed column are streamed
+    indexes = [positions[col] for col in spec["columns"]]
+    rows = [
+        [row[i] if i < len(row) else None for i in indexes]
+        for row in _read_rows(ws, spec["header_row"] + 1, max(indexes) + 1)
+    ]
+    rows = [r for r in rows if not all(_is_blank(v) for v in r)]
+
+    # object dtype keeps untouched columns as the cell values (ints stay ints)
+    df = pd.DataFrame(rows, columns=spec["columns"], dtype=object)
+    if spec["numeric"]:
+        df[spec["numeric"]] = df[spec["numeric"]].apply(pd.to_numeric, errors="coerce")
+    for col in spec.get("positive", []):
+        df = df[df[col] > 0]
+    if spec["dates"]:
+        df[spec["dates"]] = df[spec["dates"]].apply(
+            lambda s: pd.to_datetime(s, errors="coerce").dt.strftime("%Y-%m-%d")
+        )
+    df = df.astype(object).where(df.notna(), None)
+    return df.to_dict(orient="records"), []
+
+
+def budget_totals(budget_details) -> dict | None:
+    """
+    Top-level budget KPIs from the "Total" row of budget_details records, as floats
+    (None for each blank or non-numeric cell). None when there is no "Total" row.
+    """
+    total_row = next(
+        (row for row in budget_details if str(row.get("Category")).strip().lower() == "total"), None
+    )
+    if total_row is None:
+        return None
+    totals = {}
+    for field, column in BUDGET_TOTAL_FIELDS.items():
+        try:
+            totals[field] = float(total_row.get(column))
+        except (TypeError, ValueError):
+            totals[field] = None
+    return totals
+
+
+def read_excel_snapshot(data: bytes) -> dict:
+    """
+    Reads a project tracker workbook. Returns:
+        {"contents": {field: cell value}, "contacts": [...],
+         "sections": {section: [records]},
+         "missing": {section: [missing columns]}, "errors": {section: message}}
+    Sections whose sheet is absent or unreadable are left out of "sections" and
+    reported in "errors"; a missing "Contents" sheet raises ValueError.
+    """
+    wb = load_workbook(BytesIO(data), read_only=True, data_only=True)
+    try:
+        if CONTENTS_SHEET not in wb.sheetnames:
+            raise ValueError(f"Worksheet named '{CONTENTS_SHEET}' not found")
+        contents, contacts = _read_contents(wb[CONTENTS_SHEET])
+
+        result = {"contents": contents, "contacts": contacts, "sections": {}, "missing": {}, "errors": {}}
+        for section, spec in EXCEL_SHEETS.items():
+            if spec["sheet"] not in wb.sheetnames:
+                result["errors"][section] = f"Worksheet named '{spec['sheet']}' not found"
+                continue
+            try:
+                records, missing = _read_section(wb[spec["sheet"]], spec)
+            except Exception as e:
+                result["errors"][section] = str(e)
+                continue
+            if missing:
+                result["missing"][section] = missing
+            else:
+                result["sections"][section] = records
+        return result
+    finally:
+        wb.close()
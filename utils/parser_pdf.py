@@ -1,11 +1,151 @@
+import os
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
 import fitz  # PyMuPDF
+from utils.extract_cache import cached_extraction
 
+# ---------- CONFIG ----------
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(min(8, os.cpu_count() or 1))))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "16"))
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "48"))  # Smaller files: no pool start-up cost
+PDF_MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", "0")) or None
+PDF_MAX_CHARS = int(os.getenv("PDF_MAX_CHARS", "0")) or None
+# Workers never fork the (multi-threaded, sqlite / httpx holding) app process
+PDF_START_METHOD = os.getenv(
+    "PDF_START_METHOD", "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+
+# Limits change the output, so they are part of the extraction cache key
+PARSER_VERSION = f"2:{PDF_MAX_PAGES}:{PDF_MAX_CHARS}"  # Bump the leading number when the output changes
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    """The process pool shared by every PDF parse in this process, created on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=max(1, PDF_WORKERS),
+                mp_context=multiprocessing.get_context(PDF_START_METHOD)
+            )
+        return _pool
+
+
+def _discard_pool(pool) -> None:
+    """Drops a broken pool so the next parse starts a fresh one."""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _read_source(source):
+    """Returns a path (workers reopen it) or the raw bytes of an uploaded / file-like PDF."""
+    if isinstance(source, (str, os.PathLike)):
+        return os.fspath(source)
+    if isinstance(source, (bytes, bytearray)):
+        return source
+    if hasattr(source, "getvalue"):
+        return source.getvalue()
+    return source.read()
+
+
+def _open(source):
+    if isinstance(source, str):
+        return fitz.open(source)
+    return fitz.open(stream=source, filetype="pdf")
+
+
+def _extract_page_range(source, start: int, stop: int) -> list:
+    """Worker: text of pages [start, stop) of one document."""
+    with _open(source) as doc:
+        return [doc[i].get_text() for i in range(start, stop)]
+
+
+def _page_texts(source, page_count, workers, pages_per_task):
+    if workers <= 1 or page_count < PDF_PARALLEL_MIN_PAGES:
+        with _open(source) as doc:
+            for i in range(page_count):
+                yield doc[i].get_text()
+        return
+
+    # Workers reopen the document by path rather than receiving a copy of the bytes per task
+    tmp_path = None
+    if not isinstance(source, str):
+        fd, tmp_path = tempfile.mkstemp(suffix=".pdf")
+        with os.fdopen(fd, "wb") as f:
+            f.write(source)
+        source = tmp_path
+
+    ranges = [(start, min(start + pages_per_task, page_count)) for start in range(0, page_count, pages_per_task)]
+    pool = _get_pool()
+    pending = []
+    try:
+        # Keep only a few ranges of this document in flight (memory stays bounded on huge
+        # files, and concurrent parses share the pool's PDF_WORKERS processes)
+        next_range = 0
+        while next_range < len(ranges) or pending:
+            while next_range < len(ranges) and len(pending) < workers * 2:
+                pending.append(pool.submit(_extract_page_range, source, *ranges[next_range]))
+                next_range += 1
+            yield from pending.pop(0).result()
+    except BrokenProcessPool:
+        _discard_pool(pool)
+        raise
+    finally:
+        # Early stop (generator closed): drop ranges that have not started yet and wait
+        # for running ones, which still read the temporary file
+        for future in pending:
+            future.cancel()
+        wait(pending)
+        if tmp_path:
+            os.remove(tmp_path)
+
+
+def iter_pdf_pages(source, max_pages: int | None = None, max_chars: int | None = None,
+                   workers: int = PDF_WORKERS, pages_per_task: int = PDF_PAGES_PER_TASK):
+    """
+    Yields (page_number, text) in page order. Large documents are split into page ranges
+    extracted by the shared process pool; `workers` caps this document's ranges in flight. Stops after max_pages pages or once max_chars characters
+    have been yielded (the last page is cut to fit).
+    """
+    source = _read_source(source)
+    with _open(source) as doc:
+        page_count = doc.page_count
+    if max_pages is not None:
+        page_count = min(page_count, max_pages)
+
+    remaining = max_chars
+    pages = _page_texts(source, page_count, workers, pages_per_task)
+    try:
+        for page_number, text in enumerate(pages, start=1):
+            if remaining is not None:
+                text = text[:remaining]
+                remaining -= len(text)
+            yield page_number, text
+            if remaining is not None and remaining <= 0:
+                return
+    finally:
+        pages.close()
+
+
+@cached_extraction(PARSER_VERSION)
 def parse_pdf_status(file_path):
-    text = ""
-    with fitz.open(file_path) as doc:
-        for page in doc:
-            text += page.get_text()
+    source = _read_source(file_path)
+    with _open(source) as doc:
+        total_pages = doc.page_count
+
+    # Join once instead of growing a string page by page
+    texts = [text for _, text in iter_pdf_pages(source, max_pages=PDF_MAX_PAGES, max_chars=PDF_MAX_CHARS)]
     return {
-        "parsed": {},  # Could add more intelligent parsing later
-        "raw_text": text
-    }
\ No newline at end of file
+        "parsed": {"page_count": total_pages, "pages_extracted": len(texts)},
+        "raw_text": "".join(texts)
+    }
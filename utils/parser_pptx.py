@@ -1,14 +1,22 @@
 # utils/parser_pptx.py
 from pptx import Presentation
+from utils.extract_cache import cached_extraction
 
+PARSER_VERSION = 2  # Bump when the output of parse_pptx_status changes
+
+
+@cached_extraction(PARSER_VERSION)
 def parse_pptx_status(file_path):
     prs = Presentation(file_path)
-    text_runs = []
+    slides = []
     for slide in prs.slides:
+        text_runs = []
         for shape in slide.shapes:
             if hasattr(shape, "text"):
                 text_runs.append(shape.text)
+        slides.append("\n".join(text_runs))
+    # Blank line between slides so long decks can be chunked on slide boundaries
     return {
         "parsed": {},
-        "raw_text": "\n".join(text_runs)
+        "raw_text": "\n\n".join(slides)
     }
\ No newline at end of file
@@ -0,0 +1,89 @@
+# === Parser registry ===
+# Maps file extensions and MIME types to parse_*_status functions by module path. A
+# parser module (and its heavy dependency: docx, fitz, pptx, webvtt...) is only imported
+# the first time a file of that type is parsed, so starting the app or creating a project
+# pays for none of them. New formats plug in with register_parser().
+
+import time
+import importlib
+import threading
+
+_lock = threading.Lock()
+_parsers = {}     # extension -> {"module", "function", "mime_types"}
+_mime_types = {}  # MIME type -> extension
+_loaded = {}      # "module:function" -> callable
+_import_seconds = {}  # module -> seconds spent importing it (first use)
+
+
+def register_parser(extensions, module: str, function: str, mime_types=()) -> None:
+    """Registers `module.function` for the given extensions (without dot) and MIME types."""
+    with _lock:
+        for extension in extensions:
+            _parsers[extension.lower()] = {"module": module, "function": function, "mime_types": tuple(mime_types)}
+            for mime_type in mime_types:
+                _mime_types[mime_type.lower()] = extension.lower()
+
+
+def supported_extensions() -> list:
+    return sorted(_parsers)
+
+
+def resolve_extension(filename: str = "", mime_type: str | None = None) -> str | None:
+    """Registered extension for a file name, falling back to its MIME type."""
+    extension = filename.rsplit(".", 1)[-1].lower() if "." in filename else ""
+    if extension in _parsers:
+        return extension
+    if mime_type:
+        return _mime_types.get(mime_type.split(";")[0].strip().lower())
+    return None
+
+
+def get_parser(extension: str):
+    """Returns the parse function for an extension, importing its module on first use."""
+    spec = _parsers.get(extension.lower())
+    if spec is None:
+        raise ValueError("Unsupported file type.")
+
+    name = f"{spec['module']}:{spec['function']}"
+    parser = _loaded.get(name)
+    if parser is None:
+        with _lock:
+            parser = _loaded.get(name)
+            if parser is None:
+                start = time.perf_counter()
+                module = importlib.import_module(spec["module"])
+                _import_seconds.setdefault(spec["module"], time.perf_counter() - start)
+                parser = getattr(module, spec["function"])
+                _loaded[name] = parser
+    return parser
+
+
+def parse_uploaded_file(uploaded_file) -> dict:
+    """Parses an upload (Streamlit UploadedFile, or any object with .name) with its registered parser."""
+    extension = resolve_extension(uploaded_file.name, getattr(uploaded_file, "type", None))
+    if extension is None:
+        raise ValueError("Unsupported file type.")
+    return get_parser(extension)(uploaded_file)
+
+
+def get_import_report() -> list:
+    """One row per registered parser module: extensions, whether it is loaded, import time."""
+    rows = {}
+    for extension, spec in sorted(_parsers.items()):
+        row = rows.setdefault(spec["module"], {"module": spec["module"], "extensions": [], "loaded": False, "import_ms": None})
+        row["extensions"].append(extension)
+        if spec["module"] in _import_seconds:
+            row["loaded"] = True
+            row["import_ms"] = round(_import_seconds[spec["module"]] * 1000, 1)
+    return [{**row, "extensions": ", ".join(row["extensions"])} for row in rows.values()]
+
+
+# --- Built-in parsers ---
+register_parser(["docx"], "utils.parser_docx", "parse_docx_status",
+                ["application/vnd.openxmlformats-officedocument.wordprocessingml.document"])
+register_parser(["pdf"], "utils.parser_pdf", "parse_pdf_status", ["application/pdf"])
+register_parser(["pptx"], "utils.parser_pptx", "parse_pptx_status",
+                ["application/vnd.openxmlformats-officedocument.presentationml.presentation"])
+register_parser(["vtt"], "utils.parser_vtt", "parse_vtt_status", ["text/vtt"])
+register_parser(["eml"], "utils.parser_email", "parse_email_status", ["message/rfc822"])
+register_parser(["msg"], "utils.parser_email", "parse_email_status", ["application/vnd.ms-outlook"])
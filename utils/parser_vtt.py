@@ -1,5 +1,10 @@
 import webvtt
+from utils.extract_cache import cached_extraction
 
+PARSER_VERSION = 1  # Bump when the output of parse_vtt_status changes
+
+
+@cached_extraction(PARSER_VERSION)
 def parse_vtt_status(file_path):
     text = "\n".join([caption.text for caption in webvtt.read(file_path)])
     return {
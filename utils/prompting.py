@@ -0,0 +1,161 @@
+# === Prompt building + token accounting shared by every LLM call site ===
+
+import os
+import re
+import json
+import math
+import threading
+
+try:
+    import tiktoken  # Optional: exact local token counts
+    _encoding = tiktoken.get_encoding("o200k_base")
+except Exception:
+    _encoding = None
+
+CHUNK_MAX_CHARS = int(os.getenv("PROMPT_CHUNK_CHARS", "12000"))
+
+# Lines that open a new section: markdown / numbered headings, short ALL-CAPS titles, "Label:" lines
+_HEADING = re.compile(r"^(#{1,6}\s|\d+(\.\d+)*[.)]?\s+\S|[A-Z][A-Z0-9 &/,()-]{2,79}$|[^.!?]{1,80}:$)")
+
+_usage_lock = threading.Lock()
+_usage = {}  # call_site -> counters
+
+
+def prune_empty(obj):
+    """
+    Recursively drops None / NaN / "" / [] / {} values so they cost no prompt tokens.
+    List items that prune down to nothing are dropped as well.
+    """
+    if isinstance(obj, dict):
+        pruned = {}
+        for k, v in obj.items():
+            v = prune_empty(v)
+            if not _is_empty(v):
+                pruned[k] = v
+        return pruned
+    if isinstance(obj, list):
+        items = [prune_empty(v) for v in obj]
+        return [v for v in items if not _is_empty(v)]
+    return obj
+
+
+def _is_empty(value) -> bool:
+    if value is None:
+        return True
+    if isinstance(value, float) and math.isnan(value):
+        return True
+    if isinstance(value, (str, list, dict)) and len(value) == 0:
+        return True
+    return False
+
+
+def compact_json(obj, drop_empty: bool = True) -> str:
+    """Serializes prompt payloads without indentation or key/item padding."""
+    if drop_empty:
+        obj = prune_empty(obj)
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+def _split_blocks(text: str) -> list:
+    """Splits text into structural blocks: at blank lines, page/form breaks and before headings."""
+    blocks, current = [], []
+    for line in text.splitlines():
+        stripped = line.strip()
+        if not stripped:
+            if current:
+                blocks.append("\n".join(current))
+                current = []
+            continue
+        if current and _HEADING.match(stripped):
+            blocks.append("\n".join(current))
+            current = []
+        current.append(line.rstrip())
+    if current:
+        blocks.append("\n".join(current))
+    return blocks
+
+
+def split_into_chunks(text: str, max_chars: int = CHUNK_MAX_CHARS) -> list:
+    """
+    Splits document text into chunks of at most max_chars, packing whole sections
+    (headings, slides, caption blocks, pages) together and only cutting inside a
+    section, at line boundaries, when it is larger than a chunk on its own.
+    """
+    text = (text or "").strip()
+    if len(text) <= max_chars:
+        return [text] if text else []
+
+    pieces = []
+    for block in _split_blocks(text):
+        if len(block) <= max_chars:
+            pieces.append(block)
+            continue
+        for line in block.splitlines():
+            pieces.extend(line[i:i + max_chars] for i in range(0, len(line), max_chars))
+
+    chunks, current, size = [], [], 0
+    for piece in pieces:
+        added = len(piece) + (2 if current else 0)
+        if current and size + added > max_chars:
+            chunks.append("\n\n".join(current))
+            current, size = [], 0
+            added = len(piece)
+        current.append(piece)
+        size += added
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+def count_tokens(text: str) -> int:
+    """Counts tokens locally (tiktoken if installed, otherwise a ~4 chars/token estimate)."""
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return math.ceil(len(text) / 4)
+
+
+def count_message_tokens(messages: list) -> int:
+    # ~4 tokens of framing per chat message
+    return sum(count_tokens(m["content"]) + 4 for m in messages)
+
+
+def record_usage(call_site: str, estimated_prompt_tokens: int = 0, prompt_tokens: int = 0,
+                 completion_tokens: int = 0, cached: bool = False) -> None:
+    """Accumulates per-call-site usage (reported by the API, or a cache hit)."""
+    with _usage_lock:
+        entry = _usage.setdefault(call_site, {
+            "calls": 0,
+            "cache_hits": 0,
+            "estimated_prompt_tokens": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+        })
+        entry["calls"] += 1
+        entry["estimated_prompt_tokens"] += estimated_prompt_tokens
+        if cached:
+            entry["cache_hits"] += 1
+        else:
+            entry["prompt_tokens"] += prompt_tokens or 0
+            entry["completion_tokens"] += completion_tokens or 0
+
+
+def record_response_usage(call_site: str, estimated_prompt_tokens: int, response) -> None:
+    usage = getattr(response, "usage", None)
+    record_usage(
+        call_site,
+        estimated_prompt_tokens=estimated_prompt_tokens,
+        prompt_tokens=getattr(usage, "prompt_tokens", 0) if usage else 0,
+        completion_tokens=getattr(usage, "completion_tokens", 0) if usage else 0,
+    )
+
+
+def get_usage_report() -> list:
+    """Returns one row per call site, most expensive first."""
+    with _usage_lock:
+        rows = [
+            {"call_site": site, **counters, "total_tokens": counters["prompt_tokens"] + counters["completion_tokens"]}
+            for site, counters in _usage.items()
+        ]
+    return sorted(rows, key=lambda r: r["total_tokens"], reverse=True)
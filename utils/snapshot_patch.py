@@ -0,0 +1,92 @@
+# === JSON Patch (RFC 6902 subset) for snapshot delta storage ===
+# make_patch() diffs two JSON documents into "add" / "remove" / "replace" operations;
+# apply_patch() replays them. Lists are diffed by position (snapshots keep their record
+# order between versions). apply_patch() never mutates its input: only the containers
+# on changed paths are copied, unchanged sub-objects are shared with the base.
+
+
+def _escape(token) -> str:
+    return str(token).replace("~", "~0").replace("/", "~1")
+
+
+def _unescape(token: str) -> str:
+    return token.replace("~1", "/").replace("~0", "~")
+
+
+def _same(a, b) -> bool:
+    # Type-strict so 1 / 1.0 / True survive a round trip unchanged
+    return type(a) is type(b) and a == b
+
+
+def _diff(old, new, path, ops):
+    if isinstance(old, dict) and isinstance(new, dict):
+        for key in old:
+            if key not in new:
+                ops.append({"op": "remove", "path": f"{path}/{_escape(key)}"})
+        for key, value in new.items():
+            if key in old:
+                _diff(old[key], value, f"{path}/{_escape(key)}", ops)
+            else:
+                ops.append({"op": "add", "path": f"{path}/{_escape(key)}", "value": value})
+    elif isinstance(old, list) and isinstance(new, list):
+        common = min(len(old), len(new))
+        for i in range(common):
+            _diff(old[i], new[i], f"{path}/{i}", ops)
+        for i in range(len(old) - 1, common - 1, -1):
+            ops.append({"op": "remove", "path": f"{path}/{i}"})
+        for i in range(common, len(new)):
+            ops.append({"op": "add", "path": f"{path}/{i}", "value": new[i]})
+    elif not _same(old, new):
+        ops.append({"op": "replace", "path": path, "value": new})
+
+
+def make_patch(old, new) -> list:
+    """Operations that turn `old` into `new`."""
+    ops = []
+    _diff(old, new, "", ops)
+    return ops
+
+
+def apply_patch(document, patch: list):
+    """Returns `document` with `patch` applied (copy-on-write; `document` is left untouched)."""
+    copied = set()  # ids of containers already copied during this call
+
+    def writable(container):
+        if id(container) in copied:
+            return container
+        clone = dict(container) if isinstance(container, dict) else list(container)
+        copied.add(id(clone))
+        return clone
+
+    root = document
+    for op in patch:
+        tokens = [_unescape(t) for t in op["path"].split("/")[1:]]
+        if not tokens:
+            if op["op"] == "remove":
+                raise ValueError("Cannot remove the document root")
+            root = op["value"]
+            continue
+
+        root = writable(root)
+        parent = root
+        for token in tokens[:-1]:
+            key = int(token) if isinstance(parent, list) else token
+            child = writable(parent[key])
+            parent[key] = child
+            parent = child
+
+        last = tokens[-1]
+        if isinstance(parent, list):
+            index = len(parent) if last == "-" else int(last)
+            if op["op"] == "add":
+                parent.insert(index, op["value"])
+            elif op["op"] == "remove":
+                del parent[index]
+            else:
+                parent[index] = op["value"]
+        else:
+            if op["op"] == "remove":
+                del parent[last]
+            else:
+                parent[last] = op["value"]
+    return root
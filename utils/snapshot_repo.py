@@ -0,0 +1,162 @@
+# === Cached snapshot repository for the dashboard pages ===
+# Project lists and snapshot metadata come from lightweight queries; snapshot bodies are
+# decoded lazily, only for the snapshots a page actually shows, and kept in a bounded
+# LRU. Everything is shared across Streamlit sessions and reruns. A dedicated reader
+# connection polls PRAGMA data_version, which SQLite bumps whenever another connection
+# (Project_Manager, another process) commits, so caches are dropped as soon as the
+# database changes and never otherwise.
+#
+# Returned structures are shared between sessions: treat them as read-only.
+
+import os
+import threading
+from collections import OrderedDict
+from utils.db import DB_PATH, get_connection
+from utils.snapshot_store import load_snapshots
+
+MAX_CACHED_BODIES = int(os.getenv("SNAPSHOT_CACHE_SIZE", "256"))
+
+_lock = threading.Lock()
+_reader = None
+_cache = {"data_version": None, "projects": None, "metadata": {}, "bodies": OrderedDict(), "timeseries": {}}
+
+
+def _get_reader():
+    global _reader
+    if _reader is None:
+        _reader = get_connection(DB_PATH)
+    return _reader
+
+
+def _sync(conn):
+    """Drops every cached value if the database changed since the last read. Call under _lock."""
+    version = conn.execute("PRAGMA data_version").fetchone()[0]
+    if _cache["data_version"] != version:
+        _cache["data_version"] = version
+        _cache["projects"] = None
+        _cache["metadata"] = {}
+        _cache["bodies"] = OrderedDict()
+        _cache["timeseries"] = {}
+
+
+def get_data_version() -> int:
+    """Cheap change token for the database (also handy as a cache key for derived data)."""
+    with _lock:
+        conn = _get_reader()
+        _sync(conn)
+        return _cache["data_version"]
+
+
+def list_projects() -> list:
+    """Sorted ids of projects that have at least one snapshot."""
+    with _lock:
+        conn = _get_reader()
+        _sync(conn)
+        if _cache["projects"] is None:
+            rows = conn.execute("""
+                SELECT DISTINCT project_id FROM files
+                WHERE report_date IS NOT NULL AND llm_output IS NOT NULL
+                ORDER BY project_id
+            """).fetchall()
+            _cache["projects"] = [r[0] for r in rows]
+        return _cache["projects"]
+
+
+def list_snapshots(project_id) -> list:
+    """
+    Snapshot metadata for one project, newest upload first (no bodies are decoded):
+    [{"file_id", "report_date", "uploaded_at"}, ...]
+    """
+    with _lock:
+        conn = _get_reader()
+        _sync(conn)
+        if project_id not in _cache["metadata"]:
+            rows = conn.execute("""
+                SELECT id, report_date, uploaded_at FROM files
+                WHERE project_id = ? AND report_date IS NOT NULL AND llm_output IS NOT NULL
+                ORDER BY uploaded_at DESC
+            """, (project_id,)).fetchall()
+            _cache["metadata"][project_id] = [
+                {"file_id": file_id, "report_date": report_date, "uploaded_at": uploaded_at}
+                for file_id, report_date, uploaded_at in rows
+            ]
+        return _cache["metadata"][project_id]
+
+
+def get_snapshot(file_id) -> tuple:
+    """Returns (data, error) for one snapshot; data is None when it cannot be decoded."""
+    return get_snapshots([file_id])[file_id]
+
+
+def get_snapshots(file_ids) -> dict:
+    """Decodes the requested snapshots (LRU cached). Returns {file_id: (data, error)}."""
+    with _lock:
+        conn = _get_reader()
+        _sync(conn)
+        bodies = _cache["bodies"]
+
+        missing = [fid for fid in dict.fromkeys(file_ids) if fid not in bodies]
+        if missing:
+            # Keyframes and deltas are reconstructed by utils/snapshot_store.py
+            bodies.update(load_snapshots(conn, missing))
+
+        result = {}
+        for fid in file_ids:
+            bodies.move_to_end(fid)
+            result[fid] = bodies[fid]
+        while len(bodies) > MAX_CACHED_BODIES:
+            bodies.popitem(last=False)
+        return result
+
+
+def load_entries(entries) -> list:
+    """
+    Attaches decoded bodies to metadata entries from list_snapshots():
+    returns new dicts with "data" and "error" keys added, in the same order.
+    """
+    bodies = get_snapshots([e["file_id"] for e in entries])
+    return [
+        {**e, "data": bodies[e["file_id"]][0], "error": bodies[e["file_id"]][1]}
+        for e in entries
+    ]
+
+
+def _timeseries(kind, project_id, query) -> list:
+    with _lock:
+        conn = _get_reader()
+        _sync(conn)
+        key = (kind, project_id)
+        if key not in _cache["timeseries"]:
+            cursor = conn.execute(query, (project_id,))
+            columns = [c[0] for c in cursor.description]
+            _cache["timeseries"][key] = [dict(zip(columns, row)) for row in cursor.fetchall()]
+        return _cache["timeseries"][key]
+
+
+def get_kpi_timeseries(project_id) -> list:
+    """
+    One row per snapshot, oldest report first, from kpi_timeseries:
+    [{"date", "budget", "timeline", "scope", "sentiment", "percent_spent"}, ...]
+    Snapshots without a report_date are left out, as in list_snapshots().
+    percent_spent is a float or None.
+    """
+    return _timeseries("kpi", project_id, """
+        SELECT report_date AS date, budget, timeline, scope,
+               client_sentiment AS sentiment, percent_spent
+        FROM kpi_timeseries
+        WHERE project_id = ? AND report_date IS NOT NULL
+        ORDER BY report_date, uploaded_at
+    """)
+
+
+def get_budget_category_timeseries(project_id) -> list:
+    """
+    Per-category budget utilization, oldest report first, from budget_category_timeseries:
+    [{"date", "category", "percent_spent"}, ...]
+    """
+    return _timeseries("category", project_id, """
+        SELECT report_date AS date, category, percent_spent
+        FROM budget_category_timeseries
+        WHERE project_id = ? AND report_date IS NOT NULL
+        ORDER BY report_date, uploaded_at, row_index
+    """)
@@ -0,0 +1,311 @@
+# === Snapshot persistence ===
+# Single write path for project snapshots: the files row plus its normalized tables,
+# and the single read path (load_snapshot / load_snapshots).
+#
+# Delta encoding: a snapshot is stored either as a keyframe (files.llm_output holds the
+# full JSON, files.snapshot_base is NULL) or as a JSON patch (utils/snapshot_patch.py)
+# against the project's previous snapshot (files.snapshot_base = that file's id).
+# Reading a delta replays the chain from its keyframe. A new keyframe is written when the
+# patch would not be much smaller than the snapshot, or when the patches since the last
+# keyframe add up to more than SNAPSHOT_KEYFRAME_RATIO times its size, so reconstructing
+# any snapshot reads at most ~(1 + ratio) full copies.
+#
+# Large llm_output / raw_text values are compressed on write and decoded on read by
+# utils/storage_codec.py; callers only ever see text.
+
+import os
+import json
+import hashlib
+from utils.snapshot_tables import write_snapshot_tables, write_timeseries
+from utils.snapshot_patch import make_patch, apply_patch
+from utils.storage_codec import encode_text, decode_text, migrate_legacy_rows
+
+SNAPSHOT_DELTA_ENABLED = os.getenv("SNAPSHOT_DELTA_ENABLED", "1") == "1"
+SNAPSHOT_KEYFRAME_RATIO = float(os.getenv("SNAPSHOT_KEYFRAME_RATIO", "1.0"))  # Chain patch bytes / keyframe bytes
+SNAPSHOT_PATCH_MAX_RATIO = float(os.getenv("SNAPSHOT_PATCH_MAX_RATIO", "0.5"))  # Larger patches are stored as keyframes
+SNAPSHOT_MAX_CHAIN = int(os.getenv("SNAPSHOT_MAX_CHAIN", "100"))
+
+
+def content_hash(data: bytes) -> str:
+    """SHA-256 of an uploaded file's bytes (upload deduplication key)."""
+    return hashlib.sha256(data).hexdigest()
+
+
+# --- Reading ---
+
+def load_snapshots(conn, file_ids) -> dict:
+    """
+    Reconstructs the requested snapshots, fetching every row of their delta chains in one
+    query. Returns {file_id: (snapshot, error)}; snapshot is None when there is no stored
+    snapshot or it cannot be decoded. Snapshots returned by one call may share unchanged
+    sub-objects: treat them as read-only.
+    """
+    file_ids = list(dict.fromkeys(file_ids))
+    if not file_ids:
+        return {}
+    placeholders = ", ".join("?" for _ in file_ids)
+    rows = conn.execute(f"""
+        WITH RECURSIVE chain(id) AS (
+            SELECT id FROM files WHERE id IN ({placeholders})
+            UNION
+            SELECT f.snapshot_base FROM files f JOIN chain c ON f.id = c.id
+            WHERE f.snapshot_base IS NOT NULL
+        )
+        SELECT f.id, f.snapshot_base, f.llm_output FROM files f JOIN chain c ON f.id = c.id
+    """, file_ids).fetchall()
+    stored = {}
+    for file_id, base, llm_output in rows:
+        try:
+            stored[file_id] = (base, decode_text(llm_output))
+        except Exception as e:
+            stored[file_id] = (base, e)
+
+    decoded = {}
+
+    def resolve(file_id):
+        # Iterative walk down to the keyframe (or an already decoded snapshot), then replay
+        pending = []
+        current = file_id
+        while current not in decoded:
+            if current not in stored:
+                decoded[current] = (None, "Missing snapshot" if current == file_id else f"Missing delta base `{current}`")
+                break
+            base, llm_output = stored[current]
+            if isinstance(llm_output, Exception):
+                decoded[current] = (None, f"Unreadable `llm_output` — {llm_output}")
+                break
+            if not llm_output or llm_output.strip() == "":
+                decoded[current] = (None, "Empty `llm_output`")
+                break
+            if base is None:
+                try:
+                    decoded[current] = (json.loads(llm_output), None)
+                except Exception as e:
+                    decoded[current] = (None, f"Invalid JSON — {e}")
+                break
+            if current in pending or len(pending) > SNAPSHOT_MAX_CHAIN * 10:
+                decoded[current] = (None, "Corrupt delta chain")
+                break
+            pending.append(current)
+            current = base
+
+        for child in reversed(pending):
+            base_snapshot, error = decoded[stored[child][0]]
+            if base_snapshot is None:
+                decoded[child] = (None, error)
+                continue
+            try:
+                decoded[child] = (apply_patch(base_snapshot, json.loads(stored[child][1])), None)
+            except Exception as e:
+                decoded[child] = (None, f"Invalid snapshot delta — {e}")
+        return decoded[file_id]
+
+    return {file_id: resolve(file_id) for file_id in file_ids}
+
+
+def load_snapshot(conn, file_id) -> dict:
+    """The stored snapshot of one file (keyframe or delta). Raises ValueError if it cannot be loaded."""
+    snapshot, error = load_snapshots(conn, [file_id])[file_id]
+    if error:
+        raise ValueError(error)
+    return snapshot
+
+
+def find_by_content_hash(conn, digest, project_id=None):
+    """
+    Returns the most recent stored file with these exact bytes (optionally within one
+    project) as a dict with decoded metadata / snapshot, or None.
+    """
+    query = """
+        SELECT id, project_id, filename, file_type, report_date, uploaded_at, raw_text, metadata
+        FROM files
+        WHERE content_hash = ? AND llm_output IS NOT NULL
+    """
+    params = [digest]
+    if project_id is not None:
+        query += " AND project_id = ?"
+        params.append(project_id)
+    row = conn.execute(query + " ORDER BY uploaded_at DESC LIMIT 1", params).fetchone()
+    if not row:
+        return None
+
+    file_id, project_id, filename, file_type, report_date, uploaded_at, raw_text, metadata = row
+    try:
+        snapshot = load_snapshot(conn, file_id)
+        metadata = json.loads(metadata) if metadata else {}
+    except Exception:
+        return None  # Unreadable record: treat the upload as new
+    return {
+        "file_id": file_id,
+        "project_id": project_id,
+        "filename": filename,
+        "file_type": file_type,
+        "report_date": report_date,
+        "uploaded_at": uploaded_at,
+        "raw_text": decode_text(raw_text) or "",
+        "metadata": metadata,
+        "snapshot": snapshot,
+    }
+
+
+# --- Writing ---
+
+def _chain_stats(conn, file_id) -> tuple:
+    """(patch bytes since the keyframe, keyframe bytes, chain length) for a stored snapshot."""
+    return conn.execute("""
+        WITH RECURSIVE chain(id, base, size, depth) AS (
+            SELECT id, snapshot_base, LENGTH(llm_output), 0 FROM files WHERE id = ?
+            UNION ALL
+            SELECT f.id, f.snapshot_base, LENGTH(f.llm_output), c.depth + 1
+            FROM files f JOIN chain c ON f.id = c.base
+            WHERE c.depth < ?
+        )
+        SELECT COALESCE(SUM(CASE WHEN base IS NOT NULL THEN size END), 0),
+               MAX(CASE WHEN base IS NULL THEN size END),
+               COUNT(*) - 1
+        FROM chain
+    """, (file_id, SNAPSHOT_MAX_CHAIN * 10)).fetchone()
+
+
+def _encode(conn, snapshot: dict, base_id, base_snapshot) -> tuple:
+    """Returns (llm_output, snapshot_base) for storing `snapshot`: a patch against base_id or a keyframe."""
+    full = json.dumps(snapshot)
+    if not SNAPSHOT_DELTA_ENABLED or base_id is None or not isinstance(base_snapshot, dict):
+        return full, None
+
+    patch = json.dumps(make_patch(base_snapshot, snapshot))
+    if len(patch) > len(full) * SNAPSHOT_PATCH_MAX_RATIO:
+        return full, None
+
+    # Chain sizes are measured as stored (compressed), like LENGTH() in _chain_stats
+    chain_bytes, keyframe_bytes, depth = _chain_stats(conn, base_id)
+    if keyframe_bytes is None or depth + 1 > SNAPSHOT_MAX_CHAIN:
+        return full, None
+    if chain_bytes + len(encode_text(patch, "llm_output")) > keyframe_bytes * SNAPSHOT_KEYFRAME_RATIO:
+        return full, None
+
+    # Only store what replays exactly (key order, number types), otherwise fall back to a keyframe
+    if json.dumps(apply_patch(base_snapshot, json.loads(patch))) != full:
+        return full, None
+    return patch, base_id
+
+
+def _rekeyframe_dependents(conn, file_id) -> None:
+    """Stores every delta based on `file_id` as a keyframe, so the row can be overwritten."""
+    dependents = [r[0] for r in conn.execute("SELECT id FROM files WHERE snapshot_base = ?", (file_id,)).fetchall()]
+    for dependent_id, (snapshot, error) in load_snapshots(conn, dependents).items():
+        if snapshot is None:
+            continue  # Undecodable already; nothing to preserve
+        conn.execute(
+            "UPDATE files SET llm_output = ?, snapshot_base = NULL WHERE id = ?",
+            (encode_text(json.dumps(snapshot), "llm_output"), dependent_id)
+        )
+
+
+def _previous_snapshot(conn, project_id, file_id) -> tuple:
+    """(file_id, snapshot) of the project's most recently uploaded other snapshot, or (None, None)."""
+    row = conn.execute("""
+        SELECT id FROM files
+        WHERE project_id = ? AND id != ? AND llm_output IS NOT NULL
+        ORDER BY uploaded_at DESC
+        LIMIT 1
+    """, (project_id, file_id)).fetchone()
+    if not row:
+        return None, None
+    snapshot, _ = load_snapshots(conn, [row[0]])[row[0]]
+    return (row[0], snapshot) if snapshot is not None else (None, None)
+
+
+def save_snapshot(conn, file_id, project_id, filename, file_type, report_date, uploaded_at,
+                  snapshot: dict, raw_text=None, metadata=None, digest=None):
+    """
+    Inserts (or replaces) a snapshot in `files` and refreshes its normalized and
+    time-series rows.
+    raw_text / metadata / digest (files.content_hash) are only written when given.
+    The snapshot is delta-encoded against the project's previous one when that pays off.
+    """
+    _rekeyframe_dependents(conn, file_id)
+    base_id, base_snapshot = _previous_snapshot(conn, project_id, file_id)
+    llm_output, snapshot_base = _encode(conn, snapshot, base_id, base_snapshot)
+
+    columns = ["id", "project_id", "filename", "file_type", "report_date", "uploaded_at"]
+    values = [file_id, project_id, filename, file_type, report_date, uploaded_at]
+    if digest is not None:
+        columns.append("content_hash")
+        values.append(digest)
+    if raw_text is not None:
+        columns.append("raw_text")
+        values.append(encode_text(raw_text, "raw_text"))
+    if metadata is not None:
+        columns.append("metadata")
+        values.append(json.dumps(metadata))
+    columns += ["llm_output", "snapshot_base"]
+    values += [encode_text(llm_output, "llm_output"), snapshot_base]
+
+    conn.execute(
+        f"INSERT OR REPLACE INTO files ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+        values
+    )
+    write_snapshot_tables(conn, file_id, project_id, report_date, snapshot, commit=False)
+    write_timeseries(conn, file_id, project_id, report_date, uploaded_at, snapshot, commit=False)
+    conn.commit()
+    migrate_legacy_rows(conn)
+
+
+def backfill_timeseries(conn, batch_size: int = 100) -> int:
+    """
+    Writes time-series rows for every stored snapshot that has none yet (migration for
+    existing data). Returns the number of files backfilled.
+    """
+    rows = conn.execute("""
+        SELECT f.id, f.project_id, f.report_date, f.uploaded_at
+        FROM files f
+        WHERE f.llm_output IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM kpi_timeseries k WHERE k.file_id = f.id)
+    """).fetchall()
+
+    count = 0
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        bodies = load_snapshots(conn, [r[0] for r in batch])
+        for file_id, project_id, report_date, uploaded_at in batch:
+            snapshot = bodies[file_id][0]
+            if not isinstance(snapshot, dict):
+                continue  # Leave malformed rows to the pages' own error handling
+            write_timeseries(conn, file_id, project_id, report_date, uploaded_at, snapshot, commit=False)
+            count += 1
+        conn.commit()
+    return count
+
+
+def encode_snapshot_history(conn) -> int:
+    """
+    Delta-encodes stored keyframes against their predecessors in upload order (migration
+    for existing data). Keyframes chosen by the size policy stay as they are.
+    Returns the number of snapshots converted to deltas.
+    """
+    project_ids = [r[0] for r in conn.execute("SELECT DISTINCT project_id FROM files").fetchall()]
+    count = 0
+    for project_id in project_ids:
+        file_ids = [r[0] for r in conn.execute("""
+            SELECT id FROM files
+            WHERE project_id = ? AND llm_output IS NOT NULL
+            ORDER BY uploaded_at
+        """, (project_id,)).fetchall()]
+        previous_id, previous = None, None
+        for file_id in file_ids:
+            snapshot, error = load_snapshots(conn, [file_id])[file_id]
+            if snapshot is None:
+                continue  # Leave malformed rows to the pages' own error handling
+            is_keyframe = conn.execute("SELECT snapshot_base IS NULL FROM files WHERE id = ?", (file_id,)).fetchone()[0]
+            if is_keyframe and isinstance(snapshot, dict):
+                llm_output, snapshot_base = _encode(conn, snapshot, previous_id, previous)
+                if snapshot_base is not None:
+                    conn.execute(
+                        "UPDATE files SET llm_output = ?, snapshot_base = ? WHERE id = ?",
+                        (encode_text(llm_output, "llm_output"), snapshot_base, file_id)
+                    )
+                    count += 1
+            previous_id, previous = file_id, snapshot
+        conn.commit()
+    return count
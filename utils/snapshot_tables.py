@@ -0,0 +1,249 @@
+# === Normalized snapshot tables ===
+# Mirrors each snapshot section of files.llm_output into its own table, keyed by
+# file id and indexed on (project_id, report_date), so dashboards can run targeted
+# SQL instead of decoding every JSON blob.
+
+import json
+import math
+from utils.storage_codec import decode_text
+
+# table -> (snapshot section, [(column, snapshot field, SQL type), ...])
+SNAPSHOT_TABLES = {
+    "snapshot_kpis": ("kpis", [
+        ("budget", "budget", "TEXT"),
+        ("timeline", "timeline", "TEXT"),
+        ("scope", "scope", "TEXT"),
+        ("client_sentiment", "client_sentiment", "TEXT"),
+        ("allotted_budget", "allotted_budget", "REAL"),
+        ("spent_budget", "spent_budget", "REAL"),
+        ("remaining_budget", "remaining_budget", "REAL"),
+        ("percent_spent", "percent_spent", "REAL"),
+    ]),
+    "snapshot_budget_details": ("budget_details", [
+        ("category", "Category", "TEXT"),
+        ("allotted_budget", "Allotted Budget", "REAL"),
+        ("spent_budget", "Spent Budget", "REAL"),
+        ("remaining_budget", "Remaining Budget", "REAL"),
+        ("percent_spent", "Percent Spent", "REAL"),
+        ("notes", "Notes", "TEXT"),
+    ]),
+    "snapshot_schedule": ("schedule", [
+        ("task_id", "Task ID", "TEXT"),
+        ("task_name", "Task Name", "TEXT"),
+        ("description", "Description", "TEXT"),
+        ("assigned_to", "Assigned To", "TEXT"),
+        ("start_date", "Start Date", "TEXT"),
+        ("end_date", "End Date", "TEXT"),
+        ("duration_days", "Duration (Days)", "REAL"),
+        ("status", "Status", "TEXT"),
+        ("dependencies", "Dependencies", "TEXT"),
+    ]),
+    "snapshot_issues": ("issues", [
+        ("issue_number", "Issue #", "TEXT"),
+        ("creation_date", "Issue Creation Date", "TEXT"),
+        ("issue_category", "Issue Category", "TEXT"),
+        ("issue_detail", "Issue Detail", "TEXT"),
+        ("recommended_action", "Recommended Action", "TEXT"),
+        ("owner", "Owner", "TEXT"),
+        ("status", "Status", "TEXT"),
+        ("due_date", "Due Date", "TEXT"),
+        ("resolution", "Resolution", "TEXT"),
+    ]),
+    "snapshot_risks": ("risks", [
+        ("risk_id", "ID", "TEXT"),
+        ("division", "Division", "TEXT"),
+        ("task_area", "Task Area", "TEXT"),
+        ("risk_name", "Risk Name", "TEXT"),
+        ("risk_description", "Risk Description", "TEXT"),
+        ("risk_category", "Risk Category", "TEXT"),
+        ("probability_rating", "Probability Rating", "REAL"),
+        ("impact_rating", "Impact Rating", "REAL"),
+        ("risk_rating", "Risk Rating", "REAL"),
+        ("impact_if_not_mitigated", "Impact If Not Mitigated", "TEXT"),
+        ("mitigation_strategy", "Action/Mitigation Strategy", "TEXT"),
+        ("mitigation_owners", "Mitigation Owner(s)", "TEXT"),
+        ("action_taken", "Action Taken?", "TEXT"),
+        ("date_identified", "Date Identified", "TEXT"),
+    ]),
+    "snapshot_deliverables": ("deliverables", [
+        ("deliverable", "Deliverable", "TEXT"),
+        ("status", "Status", "TEXT"),
+        ("start_date", "Start Date", "TEXT"),
+        ("date_due", "Date Due", "TEXT"),
+    ]),
+}
+
+
+def create_snapshot_tables(conn):
+    for table, (_, columns) in SNAPSHOT_TABLES.items():
+        column_sql = "".join(f"{name} {sql_type}, " for name, _, sql_type in columns)
+        conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {table} (
+            file_id TEXT,
+            project_id TEXT,
+            report_date TEXT,
+            row_index INTEGER,
+            {column_sql}
+            FOREIGN KEY(file_id) REFERENCES files(id)
+        )
+        """)
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_file ON {table}(file_id)")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_project_date ON {table}(project_id, report_date)")
+    conn.commit()
+
+
+def _to_sql_value(value):
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return value
+
+
+def write_snapshot_tables(conn, file_id, project_id, report_date, snapshot: dict, commit: bool = True):
+    """Replaces every normalized row of `file_id` with the contents of `snapshot`."""
+    for table, (section, columns) in SNAPSHOT_TABLES.items():
+        conn.execute(f"DELETE FROM {table} WHERE file_id = ?", (file_id,))
+
+        records = snapshot.get(section) or []
+        if section == "kpis":
+            # Exactly one KPI row per file (also marks the file as normalized)
+            records = [records if isinstance(records, dict) else {}]
+
+        column_names = ", ".join(name for name, _, _ in columns)
+        placeholders = ", ".join("?" for _ in range(len(columns) + 4))
+        conn.executemany(
+            f"INSERT INTO {table} (file_id, project_id, report_date, row_index, {column_names}) VALUES ({placeholders})",
+            [
+                (file_id, project_id, report_date, i, *(_to_sql_value(r.get(field)) for _, field, _ in columns))
+                for i, r in enumerate(records) if isinstance(r, dict)
+            ]
+        )
+    if commit:
+        conn.commit()
+
+
+# === KPI time series (kpi_timeseries / budget_category_timeseries) ===
+# One row per snapshot (and per budget category) with just what the KPI History charts
+# plot, so the tab reads each series with one indexed query instead of decoding snapshots.
+
+def create_timeseries_tables(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS kpi_timeseries (
+        file_id TEXT PRIMARY KEY,
+        project_id TEXT,
+        report_date TEXT,
+        uploaded_at TEXT,
+        budget TEXT,
+        timeline TEXT,
+        scope TEXT,
+        client_sentiment TEXT,
+        percent_spent REAL,
+        FOREIGN KEY(file_id) REFERENCES files(id)
+    )
+    """)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS budget_category_timeseries (
+        file_id TEXT,
+        project_id TEXT,
+        report_date TEXT,
+        uploaded_at TEXT,
+        row_index INTEGER,
+        category TEXT,
+        percent_spent REAL,
+        FOREIGN KEY(file_id) REFERENCES files(id)
+    )
+    """)
+    # Index order matches the charts' ORDER BY, so reads need no sort
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_kpi_timeseries_project_date "
+        "ON kpi_timeseries(project_id, report_date, uploaded_at)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_budget_category_timeseries_file ON budget_category_timeseries(file_id)")
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_budget_category_timeseries_project_date "
+        "ON budget_category_timeseries(project_id, report_date, uploaded_at, row_index)"
+    )
+    conn.commit()
+
+
+def _to_real(value):
+    """percent_spent as a float, or None when it is missing or not a number ("45%", "n/a")."""
+    if isinstance(value, bool) or value is None:
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(number) else number
+
+
+def write_timeseries(conn, file_id, project_id, report_date, uploaded_at, snapshot: dict, commit: bool = True):
+    """Replaces the time-series rows of `file_id` with the values in `snapshot`."""
+    kpis = snapshot.get("kpis")
+    kpis = kpis if isinstance(kpis, dict) else {}
+    conn.execute("DELETE FROM kpi_timeseries WHERE file_id = ?", (file_id,))
+    conn.execute("DELETE FROM budget_category_timeseries WHERE file_id = ?", (file_id,))
+    conn.execute("""
+        INSERT INTO kpi_timeseries
+        (file_id, project_id, report_date, uploaded_at, budget, timeline, scope, client_sentiment, percent_spent)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, (
+        file_id, project_id, report_date, uploaded_at,
+        *(_to_sql_value(kpis.get(f)) for f in ("budget", "timeline", "scope", "client_sentiment")),
+        _to_real(kpis.get("percent_spent"))
+    ))
+
+    # Per-category utilization; the "Total" row duplicates the top-level KPI and is skipped
+    conn.executemany("""
+        INSERT INTO budget_category_timeseries
+        (file_id, project_id, report_date, uploaded_at, row_index, category, percent_spent)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, [
+        (file_id, project_id, report_date, uploaded_at, i, item.get("Category"), _to_real(item.get("Percent Spent")))
+        for i, item in enumerate(snapshot.get("budget_details") or [])
+        if isinstance(item, dict) and isinstance(item.get("Category"), str)
+        and item["Category"] and item["Category"].lower() != "total"
+    ])
+    if commit:
+        conn.commit()
+
+
+def coerce_timeseries_numbers(conn) -> None:
+    """Rewrites percent_spent values stored as text (before _to_real) as REAL or NULL."""
+    for table in ("kpi_timeseries", "budget_category_timeseries"):
+        rows = conn.execute(
+            f"SELECT rowid, percent_spent FROM {table} WHERE typeof(percent_spent) NOT IN ('real', 'null')"
+        ).fetchall()
+        conn.executemany(
+            f"UPDATE {table} SET percent_spent = ? WHERE rowid = ?",
+            [(_to_real(value), rowid) for rowid, value in rows]
+        )
+    conn.commit()
+
+
+def backfill_snapshot_tables(conn) -> int:
+    """
+    Normalizes every stored snapshot that has no rows yet (migration for existing data).
+    Returns the number of files backfilled. Runs before snapshots are delta-encoded
+    (migration 7), so every llm_output it reads is still full JSON.
+    """
+    rows = conn.execute("""
+        SELECT f.id, f.project_id, f.report_date, f.llm_output
+        FROM files f
+        WHERE f.llm_output IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM snapshot_kpis k WHERE k.file_id = f.id)
+    """).fetchall()
+
+    count = 0
+    for file_id, project_id, report_date, llm_output in rows:
+        try:
+            snapshot = json.loads(decode_text(llm_output))
+        except Exception:
+            continue  # Leave malformed rows to the pages' own error handling
+        if not isinstance(snapshot, dict):
+            continue
+        write_snapshot_tables(conn, file_id, project_id, report_date, snapshot, commit=False)
+        count += 1
+    conn.commit()
+    return count
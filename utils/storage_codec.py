@@ -0,0 +1,87 @@
+# === Column storage codec ===
+# Large TEXT values (files.llm_output, files.raw_text) are stored compressed as BLOBs:
+#   1 header byte (codec / format version) + payload
+# Values that are small or do not shrink stay plain TEXT, which is also how every row
+# written before this codec looks, so old and new rows can be mixed freely and are
+# converted lazily (migrate_legacy_rows). Read every such column through decode_text().
+
+import os
+import zlib
+import lzma
+
+CODEC_RAW, CODEC_ZLIB, CODEC_LZMA = 0, 1, 2
+_CODEC_IDS = {"raw": CODEC_RAW, "zlib": CODEC_ZLIB, "lzma": CODEC_LZMA}
+
+# Per-column codec: zlib for values read on every page render, lzma (smaller, slower) for
+# raw_text, which is written once and only read for duplicate uploads
+COLUMN_CODECS = {
+    "llm_output": os.getenv("STORAGE_CODEC_LLM_OUTPUT", "zlib"),
+    "raw_text": os.getenv("STORAGE_CODEC_RAW_TEXT", "lzma"),
+}
+COMPRESS_MIN_BYTES = int(os.getenv("STORAGE_COMPRESS_MIN_BYTES", "256"))
+ZLIB_LEVEL = int(os.getenv("STORAGE_ZLIB_LEVEL", "6"))
+MIGRATE_BATCH = int(os.getenv("STORAGE_MIGRATE_BATCH", "200"))  # Legacy rows converted per pass
+
+
+def encode_text(value, column: str):
+    """Storage form of a text value for `column`: plain str, or header byte + compressed BLOB."""
+    if value is None:
+        return None
+    raw = value.encode("utf-8")
+    codec = _CODEC_IDS.get(COLUMN_CODECS.get(column, "raw"), CODEC_RAW)
+    if codec == CODEC_RAW or len(raw) < COMPRESS_MIN_BYTES:
+        return value
+    if codec == CODEC_ZLIB:
+        payload = zlib.compress(raw, ZLIB_LEVEL)
+    else:
+        payload = lzma.compress(raw)
+    if len(payload) + 1 >= len(raw):
+        return value
+    return bytes([codec]) + payload
+
+
+def decode_text(value):
+    """The text behind a stored value (plain TEXT rows are returned unchanged)."""
+    if value is None or isinstance(value, str):
+        return value
+    data = bytes(value)
+    if not data:
+        return ""
+    codec, payload = data[0], data[1:]
+    if codec == CODEC_ZLIB:
+        return zlib.decompress(payload).decode("utf-8")
+    if codec == CODEC_LZMA:
+        return lzma.decompress(payload).decode("utf-8")
+    if codec == CODEC_RAW:
+        return payload.decode("utf-8")
+    raise ValueError(f"Unknown storage codec {codec}")
+
+
+def migrate_legacy_rows(conn, limit: int = MIGRATE_BATCH) -> int:
+    """
+    Re-encodes up to `limit` files rows whose large columns are still plain TEXT.
+    Called once per process start and after each save, so existing databases shrink
+    gradually without a long one-off migration. Returns the number of rows rewritten.
+    """
+    rows = conn.execute("""
+        SELECT id, llm_output, raw_text FROM files
+        WHERE (typeof(llm_output) = 'text' AND LENGTH(llm_output) >= ?)
+           OR (typeof(raw_text) = 'text' AND LENGTH(raw_text) >= ?)
+        LIMIT ?
+    """, (COMPRESS_MIN_BYTES, COMPRESS_MIN_BYTES, limit)).fetchall()
+
+    for file_id, llm_output, raw_text in rows:
+        conn.execute(
+            "UPDATE files SET llm_output = ?, raw_text = ? WHERE id = ?",
+            (_encode_legacy(llm_output, "llm_output"), _encode_legacy(raw_text, "raw_text"), file_id)
+        )
+    conn.commit()
+    return len(rows)
+
+
+def _encode_legacy(value, column: str):
+    if not isinstance(value, str) or len(value) < COMPRESS_MIN_BYTES:
+        return value
+    encoded = encode_text(value, column)
+    # Incompressible values get the raw header so later passes do not pick them up again
+    return encoded if isinstance(encoded, bytes) else bytes([CODEC_RAW]) + value.encode("utf-8")